@@ -0,0 +1,152 @@
+# app/cache.py
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from pydantic import BaseModel
+
+from .encoding import canonical
+
+
+def canonical_key(payload: BaseModel, *parts) -> str:
+    # Hash of the request's canonical encoding (app.encoding: whitespace- and
+    # key-order-insensitive) plus whatever else changes the answer (model
+    # name, prompt version, ...).
+    body = json.dumps([canonical(payload), *parts], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+# Rows are kept for stale_grace seconds past their expiry, for get_stale(),
+# and purged by the first write at least cleanup_interval seconds after the
+# last purge, through an index on expires_at.
+class _DiskTier:
+    def __init__(self, path, stale_grace, cleanup_interval):
+        self.stale_grace = stale_grace
+        self.cleanup_interval = cleanup_interval
+        self._next_cleanup = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS response_cache_expires_at ON response_cache (expires_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        return row
+
+    def set(self, key, value, expires_at):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            if now >= self._next_cleanup:
+                self._next_cleanup = now + self.cleanup_interval
+                self._conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now - self.stale_grace,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Two-tier cache: an in-memory LRU with TTL and size-based eviction in front
+# of an optional SQLite file that survives restarts.
+class ResponseCache:
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=24 * 3600, db_path=None,
+                 stale_grace=7 * 24 * 3600, cleanup_interval=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_grace = stale_grace
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self._disk = _DiskTier(db_path, stale_grace, cleanup_interval) if db_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, key) -> Optional[str]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        # An expired entry stays until it is replaced or evicted, for get_stale()
+        if self._disk is not None:
+            row = await asyncio.to_thread(self._disk.get, key, now)
+            if row is not None:
+                self._store(key, row[0], row[1])
+                self.disk_hits += 1
+                return row[0]
+        self.misses += 1
+        return None
+
+    async def get_stale(self, key) -> Optional[str]:
+        # The entry for key even if it has expired, up to stale_grace seconds ago
+        oldest = time.time() - self.stale_grace
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > oldest:
+            return entry[1]
+        if self._disk is not None:
+            row = await asyncio.to_thread(self._disk.get, key, oldest)
+            if row is not None:
+                return row[0]
+        return None
+
+    async def set(self, key, value: str):
+        expires_at = time.time() + self.ttl
+        self._store(key, value, expires_at)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value, expires_at)
+
+    def _store(self, key, value, expires_at):
+        if key in self._entries:
+            self._remove(key)
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (expires_at, value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[2]
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "diskHits": self.disk_hits,
+            "misses": self.misses,
+            "hitRatio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
@@ -0,0 +1,173 @@
+# app/config.py
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _mapping(name, value=str, default=''):
+    # "a=1, b=2" -> {"a": value("1"), "b": value("2")}
+    pairs = (pair.partition('=') for pair in os.getenv(name, default).split(',') if pair.strip())
+    return {key.strip(): value(item.strip()) for key, _, item in pairs}
+
+
+def _list(name, default=''):
+    return [item.strip() for item in os.getenv(name, default).split(',') if item.strip()]
+
+
+# Get your OpenAI API key from environment variables
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Point at a local OpenAI-compatible server (e.g. for load tests) when set
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+
+# Shared upstream connection pool
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '64'))
+LLM_MAX_KEEPALIVE = int(os.getenv('LLM_MAX_KEEPALIVE', '32'))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv('LLM_KEEPALIVE_EXPIRY', '60'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '120'))
+
+# Resilience of upstream calls: attempts per call with full-jitter
+# exponential backoff, limited by a budget of LLM_RETRY_BUDGET_RATIO extra
+# calls per call (plus a trickle per second)
+LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', '3'))
+LLM_RETRY_BACKOFF = float(os.getenv('LLM_RETRY_BACKOFF', '0.5'))
+LLM_RETRY_BACKOFF_MAX = float(os.getenv('LLM_RETRY_BACKOFF_MAX', '8'))
+LLM_RETRY_BUDGET_RATIO = float(os.getenv('LLM_RETRY_BUDGET_RATIO', '0.2'))
+LLM_RETRY_BUDGET_MIN_PER_SEC = float(os.getenv('LLM_RETRY_BUDGET_MIN_PER_SEC', '1'))
+# Send a duplicate of a non-streamed call that is slower than the recent
+# LLM_HEDGE_QUANTILE latency (never sooner than LLM_HEDGE_MIN_DELAY seconds)
+LLM_HEDGE = os.getenv('LLM_HEDGE', 'false').lower() in ('1', 'true', 'yes')
+LLM_HEDGE_QUANTILE = float(os.getenv('LLM_HEDGE_QUANTILE', '0.95'))
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '0.5'))
+# Circuit breaker per model: opens when BREAKER_FAILURE_RATIO of the last
+# BREAKER_WINDOW calls failed, for BREAKER_COOLDOWN seconds
+BREAKER_WINDOW = int(os.getenv('BREAKER_WINDOW', '20'))
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '10'))
+BREAKER_FAILURE_RATIO = float(os.getenv('BREAKER_FAILURE_RATIO', '0.5'))
+BREAKER_COOLDOWN = float(os.getenv('BREAKER_COOLDOWN', '30'))
+# Serve an expired cached answer when the upstream cannot produce a new one
+CACHE_STALE_FALLBACK = os.getenv('CACHE_STALE_FALLBACK', 'true').lower() in ('1', 'true', 'yes')
+# Seconds an expired answer is kept for that fallback, and seconds between
+# purges of older ones from the on-disk cache tier
+CACHE_STALE_GRACE = float(os.getenv('CACHE_STALE_GRACE', str(7 * 24 * 3600)))
+CACHE_CLEANUP_INTERVAL = float(os.getenv('CACHE_CLEANUP_INTERVAL', '300'))
+# Seconds each endpoint (and each batch item) may spend on upstream calls;
+# 0 leaves only LLM_TIMEOUT per attempt
+DEADLINE_RESULT = float(os.getenv('DEADLINE_RESULT', '60'))
+DEADLINE_PATIENT = float(os.getenv('DEADLINE_PATIENT', '60'))
+DEADLINE_BATCH_ITEM = float(os.getenv('DEADLINE_BATCH_ITEM', '120'))
+
+RESULT_MODEL = "gpt-4o"
+PATIENT_MODEL = "ft:gpt-3.5-turbo-0125:wellcomlab:yagseonjido:9ogv0TRQ"
+
+# Model router: candidates per route in order of preference. Cache keys keep
+# naming RESULT_MODEL / PATIENT_MODEL, so an answer from a fallback model is
+# cached like one from the primary.
+ROUTE_RESULT = _list('ROUTE_RESULT', RESULT_MODEL)
+ROUTE_PATIENT = _list('ROUTE_PATIENT', f'{PATIENT_MODEL},{RESULT_MODEL}')
+# A candidate is skipped while its p95 on the route is above the route's SLO
+# (seconds) or its error rate above ROUTER_MAX_ERROR_RATE
+ROUTE_LATENCY_SLO = _mapping('ROUTE_LATENCY_SLO', float, 'result=60,patient=20')
+ROUTER_MAX_ERROR_RATE = float(os.getenv('ROUTER_MAX_ERROR_RATE', '0.2'))
+ROUTER_MIN_SAMPLES = int(os.getenv('ROUTER_MIN_SAMPLES', '20'))
+ROUTER_PROBE_RATIO = float(os.getenv('ROUTER_PROBE_RATIO', '0.05'))
+# explainTypes sent to the candidate with the lowest recent p50, e.g. "2"
+ROUTE_FASTEST_EXPLAIN_TYPES = [int(level) for level in _list('ROUTE_FASTEST_EXPLAIN_TYPES')]
+# Context limit (prompt tokens) and price (dollars per 1M input/output
+# tokens) per model
+MODEL_MAX_PROMPT_TOKENS = _mapping(
+    'MODEL_MAX_PROMPT_TOKENS', int, f'{RESULT_MODEL}=120000,{PATIENT_MODEL}=14000'
+)
+MODEL_PRICES = _mapping(
+    'MODEL_PRICES', lambda price: tuple(float(part) for part in price.split('/')),
+    f'{RESULT_MODEL}=2.5/10,{PATIENT_MODEL}=3/6',
+)
+# Dollars per hour after which the cheapest healthy candidate is used; 0 = no budget
+ROUTER_BUDGET_PER_HOUR = float(os.getenv('ROUTER_BUDGET_PER_HOUR', '0'))
+
+# Provider rate limits per model (requests / tokens per minute) enforced by
+# the scheduler in front of every completion call; 0 means no limit. Set
+# them to the account's tier limits.
+RESULT_MODEL_RPM = int(os.getenv('RESULT_MODEL_RPM', '0'))
+RESULT_MODEL_TPM = int(os.getenv('RESULT_MODEL_TPM', '0'))
+PATIENT_MODEL_RPM = int(os.getenv('PATIENT_MODEL_RPM', '0'))
+PATIENT_MODEL_TPM = int(os.getenv('PATIENT_MODEL_TPM', '0'))
+# Token cost estimate of a call: prompt chars / LLM_CHARS_PER_TOKEN plus the
+# expected completion; corrected with the reported usage afterwards
+LLM_CHARS_PER_TOKEN = float(os.getenv('LLM_CHARS_PER_TOKEN', '1.5'))
+LLM_COMPLETION_TOKENS_ESTIMATE = int(os.getenv('LLM_COMPLETION_TOKENS_ESTIMATE', '800'))
+# Longest expected queueing time (seconds) before a call is refused with
+# 503 + Retry-After, by priority
+SCHEDULER_SLO_INTERACTIVE = float(os.getenv('SCHEDULER_SLO_INTERACTIVE', '10'))
+SCHEDULER_SLO_BATCH = float(os.getenv('SCHEDULER_SLO_BATCH', '120'))
+SCHEDULER_SLO_PREFETCH = float(os.getenv('SCHEDULER_SLO_PREFETCH', '2'))
+# Upstream calls open at once across all tenants; the rest wait in the fair
+# queue instead of the connection pool's FIFO (0 means no limit)
+LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', os.getenv('LLM_MAX_CONNECTIONS', '64')))
+
+# Tenants sharing the server. With TENANT_API_KEYS ("key=tenant,...") the
+# API key decides the tenant; otherwise the X-Tenant-ID header does, for
+# tenants listed in TENANT_WEIGHTS or TENANT_CONCURRENCY (others are default).
+TENANT_API_KEYS = _mapping('TENANT_API_KEYS')
+# Fair-queuing weights ("tenant=2,...") and upstream concurrency caps
+# ("tenant=8,..."); tenants of API keys not listed get weight 1 and the
+# default cap
+TENANT_WEIGHTS = _mapping('TENANT_WEIGHTS', float)
+TENANT_CONCURRENCY = _mapping('TENANT_CONCURRENCY', int)
+TENANT_DEFAULT_CONCURRENCY = int(os.getenv('TENANT_DEFAULT_CONCURRENCY', '32'))
+
+# /simulation/result/ response cache
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '1024'))
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', str(24 * 3600)))
+# SQLite file for the on-disk tier; leave unset to keep the cache in memory only
+RESULT_CACHE_DB = os.getenv('RESULT_CACHE_DB') or None
+
+# /simulation/patient/ response cache (the two caches may share one SQLite file)
+PATIENT_CACHE_MAX_ENTRIES = int(os.getenv('PATIENT_CACHE_MAX_ENTRIES', '1024'))
+PATIENT_CACHE_MAX_BYTES = int(os.getenv('PATIENT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+PATIENT_CACHE_TTL = float(os.getenv('PATIENT_CACHE_TTL', str(24 * 3600)))
+PATIENT_CACHE_DB = os.getenv('PATIENT_CACHE_DB') or None
+# Explain each prescription and reaction in its own cached call instead of
+# generating the whole /simulation/patient/ response at once
+PATIENT_FRAGMENTS = os.getenv('PATIENT_FRAGMENTS', 'true').lower() in ('1', 'true', 'yes')
+# Ask for all three explainType levels in one call and cache each of them,
+# so switching levels for the same scenario needs no further call
+EXPLAIN_ALL_LEVELS = os.getenv('EXPLAIN_ALL_LEVELS', 'false').lower() in ('1', 'true', 'yes')
+
+# Background prefetch of the per-item explanations a /simulation/patient/
+# call is likely to need after /simulation/result/ (needs PATIENT_FRAGMENTS)
+PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', '2'))
+PREFETCH_QUEUE_SIZE = int(os.getenv('PREFETCH_QUEUE_SIZE', '256'))
+PREFETCH_MAX_AGE = float(os.getenv('PREFETCH_MAX_AGE', '300'))
+# Paths of the graph (in ranking order) whose nodes are prefetched
+PREFETCH_PATHS = int(os.getenv('PREFETCH_PATHS', '3'))
+PREFETCH_EXPLAIN_TYPE = int(os.getenv('PREFETCH_EXPLAIN_TYPE', '1'))
+# Workers wait while at least this many other upstream calls are open
+PREFETCH_PAUSE_INFLIGHT = int(os.getenv('PREFETCH_PAUSE_INFLIGHT', '16'))
+
+# Server-side sessions: /simulation/result/ graphs that /simulation/patient/
+# can reference by graphId; the TTL is extended on every use
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', '10000'))
+SESSION_TTL = float(os.getenv('SESSION_TTL', '3600'))
+
+# /simulation/result/batch fan-out
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '500'))
+
+# Offline Batch API pipeline (python -m app.offline)
+OFFLINE_JOBS_DB = os.getenv('OFFLINE_JOBS_DB', 'offline_jobs.sqlite3')
+OFFLINE_WORK_DIR = os.getenv('OFFLINE_WORK_DIR', 'offline_batches')
+OFFLINE_POLL_INTERVAL = float(os.getenv('OFFLINE_POLL_INTERVAL', '60'))
+
+# Drug knowledge base used to build result graphs locally; set to an empty
+# string to always let the model generate the whole graph
+DRUG_KB_PATH = os.getenv('DRUG_KB_PATH', os.path.join(os.path.dirname(__file__), 'data', 'drug_kb.json'))
+DRUG_KB_MAX_PER_TIER = int(os.getenv('DRUG_KB_MAX_PER_TIER', '3'))
+
+# Interaction / contraindication matrix screened against currentMedications
+# and allergies; set to an empty string to disable screening
+INTERACTIONS_PATH = os.getenv('INTERACTIONS_PATH', os.path.join(os.path.dirname(__file__), 'data', 'interactions.json'))
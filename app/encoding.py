@@ -0,0 +1,108 @@
+# app/encoding.py
+import json
+
+from pydantic import BaseModel
+
+from .models import PatientInfo, PatientScenario, Prescription, Reaction, SimulateResult
+
+# Compact, deterministic text form of a patient and their scenario, used as
+# prompt input and as the canonical form cache keys are hashed from. Every
+# prescription or reaction is one line of fields separated by FIELD, with
+# list items (and explain entries, as key=value in key order) separated by
+# ITEM. Field names are not repeated per item; the prompt states the field
+# order once (SCENARIO_LEGEND). Whitespace runs collapse to one space and
+# separators inside values are escaped, so equal requests encode equally and
+# different ones never do.
+FIELD = "|"
+ITEM = ";"
+EMPTY = "-"
+_ESCAPES = str.maketrans({"\\": "\\\\", FIELD: "\\" + FIELD, ITEM: "\\" + ITEM, "=": "\\="})
+
+SCENARIO_LEGEND = "약물: ATC코드|분류|한글명|영문명|효능, 부작용: 이름|항목=내용|주의사항, 여러 값은 ;로 구분"
+
+# (field, label, unit) of the patient lines, in prompt order
+PATIENT_LINES = (
+    ("name", "이름", ""),
+    ("birthdate", "생년월일", ""),
+    ("sex", "성별", ""),
+    ("weight", "체중", " kg"),
+    ("height", "키", " cm"),
+    ("bloodPressure", "혈압", ""),
+    ("pastDiseases", "과거 병력", ""),
+    ("currentMedications", "현재 복용 약물", ""),
+    ("allergies", "알레르기", ""),
+    ("familyHistory", "가족력", ""),
+    ("symptoms", "증상", ""),
+    ("onset", "발병 시기", ""),
+    ("painLevel", "통증 수준", ""),
+)
+
+SCENARIO_SECTIONS = (
+    ("prescription1", "처방 약물 1"),
+    ("reaction1", "부작용 1"),
+    ("prescription2", "추가 처방 약물"),
+    ("reaction2", "추가 부작용"),
+)
+
+
+def _text(value):
+    return " ".join(str(value).split())
+
+
+def _field(value):
+    return _text(value).translate(_ESCAPES)
+
+
+def encode_prescription(prescription: Prescription):
+    return FIELD.join((
+        _field(prescription.drugId), _field(prescription.drugType), _field(prescription.labelKo),
+        _field(prescription.labelEn), ITEM.join(_field(effect) for effect in prescription.efficacy),
+    ))
+
+
+def encode_reaction(reaction: Reaction):
+    explain = ITEM.join(f"{_field(key)}={_field(value)}" for key, value in sorted(reaction.explain.items()))
+    return FIELD.join((_field(reaction.label), explain, _field(reaction.alert)))
+
+
+def encode_item(item: BaseModel):
+    return encode_prescription(item) if isinstance(item, Prescription) else encode_reaction(item)
+
+
+def encode_scenario(scenario: PatientScenario):
+    lines = []
+    for section, label in SCENARIO_SECTIONS:
+        lines.append(f"{label}:")
+        lines.extend(encode_item(item) for item in getattr(scenario, section))
+        if not getattr(scenario, section):
+            lines.append(EMPTY)
+    return "\n".join(lines)
+
+
+def encode_patient(patient_info: BaseModel):
+    # Values are last on their line, so only whitespace needs normalizing
+    return "\n".join(
+        f"{label}: {_text(getattr(patient_info, field))}{unit}" for field, label, unit in PATIENT_LINES
+    )
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return _text(value)
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def canonical(payload: BaseModel) -> str:
+    # The encoding above for patients and scenarios; whitespace-normalized,
+    # key-sorted compact JSON for anything else
+    if isinstance(payload, SimulateResult):
+        return f"{encode_patient(payload)}\n설명 유형: {payload.explainType}\n{encode_scenario(payload.scenario)}"
+    if isinstance(payload, PatientInfo):
+        return encode_patient(payload)
+    if isinstance(payload, PatientScenario):
+        return encode_scenario(payload)
+    return json.dumps(_normalize(payload.model_dump()), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
@@ -0,0 +1,114 @@
+# app/explain.py
+import re
+from datetime import date
+from typing import Dict, List, Tuple
+
+from pydantic import BaseModel
+
+from .models import PatientExplanation, PatientFeatures, Prescription, Reaction, SimulateResult
+from .prompts import NAME_PLACEHOLDER
+
+SECTIONS = ("prescription1", "reaction1", "prescription2", "reaction2")
+
+
+def age_group(birthdate, today=None) -> str:
+    # "990818" / "1999-08-18" -> "20대"; the age band is all the per-item
+    # explanations need, and it keeps them shareable between patients
+    today = today or date.today()
+    digits = re.sub(r"\D", "", birthdate)
+    if len(digits) == 8:
+        year = int(digits[:4])
+    elif len(digits) == 6:
+        year = 2000 + int(digits[:2])
+        if year > today.year:
+            year -= 100
+    else:
+        return "알 수 없음"
+    age = today.year - year
+    return f"{age // 10 * 10}대" if age >= 10 else "10세 미만"
+
+
+def patient_features(patient_info: BaseModel, screen=None) -> PatientFeatures:
+    # screen: the patient's PatientScreen. Medications and allergies are
+    # reduced to the drug classes the interaction engine reads from them, so
+    # patients on the same classes share explanations; without the engine
+    # they are the whitespace-normalized text as given.
+    if screen is not None:
+        medications, allergies = screen.engine.labels(screen.medications), screen.engine.labels(screen.allergies)
+    else:
+        medications = " ".join(patient_info.currentMedications.split())
+        allergies = " ".join(patient_info.allergies.split())
+    return PatientFeatures(sex=patient_info.sex, ageGroup=age_group(patient_info.birthdate),
+                           pastDiseases=patient_info.pastDiseases, currentMedications=medications or "없음",
+                           allergies=allergies or "없음")
+
+
+def item_key(kind, item: BaseModel):
+    # What an item's explanation is cached under: a prescription by its ATC
+    # code and name, as one code covers several products
+    return (item.drugId, item.labelKo) if kind == "prescription" else item.label
+
+
+def fragment_items(patient_info: SimulateResult) -> List[Tuple[str, str, str, BaseModel]]:
+    # (section, kind, key, item) for every prescription and reaction of the
+    # scenario; key is what the explanation is cached under
+    items = []
+    for section in SECTIONS:
+        kind = "prescription" if section.startswith("prescription") else "reaction"
+        for item in getattr(patient_info.scenario, section):
+            items.append((section, kind, item_key(kind, item), item))
+    return items
+
+
+def personalize(value, name):
+    if isinstance(value, str):
+        return value.replace(NAME_PLACEHOLDER, f"{name}님")
+    if isinstance(value, dict):
+        return {personalize(k, name): personalize(v, name) for k, v in value.items()}
+    if isinstance(value, list):
+        return [personalize(v, name) for v in value]
+    return value
+
+
+def assemble_explanation(name, fragments: Dict[str, List[list]], total: list) -> PatientExplanation:
+    # fragments: section -> the items of each of its prescriptions/reactions,
+    # in scenario order
+    sections = {section: [entry for items in fragments.get(section, []) for entry in items] for section in SECTIONS}
+    return PatientExplanation(**personalize(sections, name), totalResult=total)
+
+
+def likely_items(graph: dict, max_paths) -> List[Tuple[str, str, BaseModel]]:
+    # (kind, key, item) for every node on the first max_paths
+    # prescription1 -> reaction1 -> prescription2 -> reaction2 paths of a
+    # graph (canonical JSON form), in graph order, which is ranking order for
+    # knowledge base graphs
+    nodes = {node["id"]: node for node in graph["nodes"]}
+    children = {}
+    for edge in graph["edges"]:
+        children.setdefault(edge["from"], []).append(edge["to"])
+
+    paths = []
+
+    def walk(path):
+        if len(paths) >= max_paths:
+            return
+        following = [node_id for node_id in children.get(path[-1], []) if node_id in nodes]
+        if not following:
+            paths.append(path)
+        for node_id in following:
+            walk(path + [node_id])
+
+    for node_id in nodes:
+        if node_id.startswith("prescription1-"):
+            walk([node_id])
+
+    items = {}
+    for node_id in (node_id for path in paths[:max_paths] for node_id in path):
+        node = nodes[node_id]
+        if "drugId" in node:
+            item = Prescription(**{field: node[field] for field in Prescription.model_fields})
+            items.setdefault(("prescription", item_key("prescription", item)), item)
+        else:
+            item = Reaction(**{field: node[field] for field in Reaction.model_fields})
+            items.setdefault(("reaction", item_key("reaction", item)), item)
+    return [(kind, key, item) for (kind, key), item in items.items()]
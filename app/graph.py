@@ -0,0 +1,71 @@
+# app/graph.py
+import re
+
+from . import metrics
+from .models import GraphMeta, PrescriptionNode, ReactionNode, SimulationGraph
+
+# Cascade order; an edge must go from one tier to the next
+TIERS = ("prescription1", "reaction1", "prescription2", "reaction2")
+TIER_INDEX = {tier: i for i, tier in enumerate(TIERS)}
+TIER_KIND = {"prescription1": PrescriptionNode, "reaction1": ReactionNode,
+             "prescription2": PrescriptionNode, "reaction2": ReactionNode}
+NODE_ID = re.compile(r"^(prescription[12]|reaction[12])-\d+$")
+
+
+# Checks a generated graph in one pass over nodes and one over edges and
+# repairs it deterministically instead of asking the model again:
+#
+#   - nodes with an id that is not "<tier>-<n>", or whose fields do not match
+#     the tier (a reaction under "prescription1-2"), are dropped
+#   - a repeated node id keeps the first node and drops the rest
+#   - edges to or from an unknown id are dropped
+#   - an edge running one tier backwards is reversed, any other edge that
+#     does not go to the next tier is dropped, and duplicate edges are dropped
+#
+# Every repair is recorded in graph.meta.repairs.
+def fix_graph(graph: SimulationGraph) -> SimulationGraph:
+    repairs = []
+    tiers = {}
+    nodes = []
+    for node in graph.nodes:
+        match = NODE_ID.match(node.id)
+        if match is None:
+            repairs.append(f"dropped node {node.id!r}: id is not <tier>-<n>")
+            continue
+        tier = match.group(1)
+        if not isinstance(node, TIER_KIND[tier]):
+            repairs.append(f"dropped node {node.id!r}: not a {tier} node")
+            continue
+        if node.id in tiers:
+            repairs.append(f"dropped node {node.id!r}: duplicate id")
+            continue
+        tiers[node.id] = TIER_INDEX[tier]
+        nodes.append(node)
+
+    seen = set()
+    edges = []
+    for edge in graph.edges:
+        source, target = tiers.get(edge.source), tiers.get(edge.to)
+        if source is None or target is None:
+            missing = edge.source if source is None else edge.to
+            repairs.append(f"dropped edge {edge.source}->{edge.to}: unknown node {missing!r}")
+            continue
+        if source == target + 1:
+            repairs.append(f"reversed edge {edge.source}->{edge.to}")
+            edge = edge.model_copy(update={"source": edge.to, "to": edge.source})
+        elif source + 1 != target:
+            repairs.append(f"dropped edge {edge.source}->{edge.to}: skips the tier order")
+            continue
+        pair = (edge.source, edge.to)
+        if pair in seen:
+            repairs.append(f"dropped edge {edge.source}->{edge.to}: duplicate")
+            continue
+        seen.add(pair)
+        edges.append(edge)
+
+    if not repairs:
+        return graph
+    for repair in repairs:
+        metrics.graph_repairs.inc(repair.split(" ", 1)[0])
+    return SimulationGraph(nodes=nodes, edges=edges, review=graph.review,
+                           meta=GraphMeta(repairs=graph.meta.repairs + repairs))
@@ -0,0 +1,160 @@
+# app/interactions.py
+import logging
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+import orjson
+
+from . import metrics
+from .graph import fix_graph
+from .models import GraphMeta, PatientInfo, PrescriptionNode, SimulationGraph
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = Path(__file__).parent / "data" / "interactions.json"
+SEVERITY_LABELS = {"contraindicated": "병용 금기", "major": "병용 주의(중대)", "moderate": "병용 주의"}
+
+
+class Screening(NamedTuple):
+    rejected: bool
+    alerts: Tuple[str, ...]
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+# Interaction and contraindication screening (app/data/interactions.json).
+# Every drug class gets a bit; an ATC code maps to the mask of the classes it
+# belongs to, and the free-text medication and allergy fields map to the
+# union of the masks of the names found in them. The pairwise interaction
+# matrix is one partner mask per class, so screening a drug against a patient
+# is an AND per class bit of the drug (usually one or two).
+class InteractionEngine:
+    def __init__(self, path=DEFAULT_PATH):
+        start = time.perf_counter()
+        data = orjson.loads(Path(path).read_bytes())
+        self.version = data["version"]
+        self.classes = [(item["name"], item["labelKo"], tuple(item["atc"])) for item in data["classes"]]
+        index = {name: i for i, (name, _, _) in enumerate(self.classes)}
+
+        self._partners = [0] * len(self.classes)
+        self._pairs: Dict[Tuple[int, int], Tuple[str, str]] = {}
+        for item in data["interactions"]:
+            a, b = (index[name] for name in item["classes"])
+            for i, j in ((a, b), (b, a)):
+                self._partners[i] |= 1 << j
+                self._pairs[i, j] = (item["severity"], item["message"])
+
+        self._cross = [0] * len(self.classes)
+        self._cross_pairs: Dict[Tuple[int, int], Tuple[str, str]] = {}
+        for item in data["allergyCrossReactions"]:
+            allergy, drug = index[item["allergy"]], index[item["drug"]]
+            self._cross[drug] |= 1 << allergy
+            self._cross_pairs[drug, allergy] = (item["severity"], item["message"])
+
+        self.mask = lru_cache(maxsize=4096)(self._mask)
+        self._parse = lru_cache(maxsize=4096)(self._parse_text)
+        # Longest names first so "아세트 아미노펜" is not also read as a shorter alias
+        self._aliases = sorted(((name.lower(), self.mask_of_all(codes)) for name, codes in data["aliases"].items()),
+                               key=lambda alias: -len(alias[0]))
+        self.load_seconds = time.perf_counter() - start
+        logger.info("Loaded interaction matrix v%s: %d classes, %d interactions in %.1f ms",
+                    self.version, len(self.classes), len(self._pairs) // 2, self.load_seconds * 1000)
+
+    def _mask(self, code) -> int:
+        # Classes an ATC code (or an ATC group prefix such as "C07") belongs to
+        mask = 0
+        for i, (_, _, prefixes) in enumerate(self.classes):
+            if any(code.startswith(prefix) or prefix.startswith(code) for prefix in prefixes):
+                mask |= 1 << i
+        return mask
+
+    def mask_of_all(self, codes) -> int:
+        mask = 0
+        for code in codes:
+            mask |= self.mask(code)
+        return mask
+
+    def _parse_text(self, text) -> int:
+        text = text.lower()
+        mask = 0
+        for name, alias_mask in self._aliases:
+            if name in text:
+                mask |= alias_mask
+                text = text.replace(name, " ")
+        return mask
+
+    def labels(self, mask):
+        # Class labels of a mask, in matrix order
+        return ", ".join(self.classes[i][1] for i in _bits(mask))
+
+    def screener(self, patient_info: PatientInfo) -> "PatientScreen":
+        return PatientScreen(self, self._parse(patient_info.currentMedications), self._parse(patient_info.allergies))
+
+    def screen(self, medications: int, allergies: int, drug_id) -> Screening:
+        drug = self.mask(drug_id)
+        rejected = False
+        alerts = []
+        for i in _bits(drug):
+            label = self.classes[i][1]
+            if allergies >> i & 1:
+                rejected = True
+                alerts.append(f"알레르기 금기: {label} 과민반응 병력")
+            for j in _bits(self._cross[i] & allergies):
+                _, message = self._cross_pairs[i, j]
+                alerts.append(f"알레르기 주의: {message}")
+            if medications >> i & 1:
+                alerts.append(f"중복 투여 주의: 현재 {label} 약물 복용 중")
+            for j in _bits(self._partners[i] & medications):
+                severity, message = self._pairs[i, j]
+                rejected = rejected or severity == "contraindicated"
+                alerts.append(f"{SEVERITY_LABELS[severity]}: 현재 복용 중인 {self.classes[j][1]} 약물과 {message}")
+        return Screening(rejected, tuple(dict.fromkeys(alerts)))
+
+
+class PatientScreen:
+    # One patient's parsed medication and allergy masks, with each drug
+    # screened at most once
+    def __init__(self, engine: InteractionEngine, medications: int, allergies: int):
+        self.engine = engine
+        self.medications = medications
+        self.allergies = allergies
+        self._results: Dict[str, Screening] = {}
+
+    def screen(self, drug_id) -> Screening:
+        result = self._results.get(drug_id)
+        if result is None:
+            result = self._results[drug_id] = self.engine.screen(self.medications, self.allergies, drug_id)
+            metrics.drug_screenings.inc("rejected" if result.rejected else "alert" if result.alerts else "clear")
+        return result
+
+    def allowed(self, drug_id) -> bool:
+        return not self.screen(drug_id).rejected
+
+    def alert(self, drug_id):
+        alerts = self.screen(drug_id).alerts
+        return " / ".join(alerts) if alerts else None
+
+    def annotate(self, graph: SimulationGraph) -> SimulationGraph:
+        # For model-generated graphs: sets the alert of every prescription
+        # node, drops rejected ones (recorded in meta.repairs) and lets
+        # fix_graph drop the edges that pointed at them
+        nodes: List = []
+        repairs = []
+        for node in graph.nodes:
+            if isinstance(node, PrescriptionNode):
+                screening = self.screen(node.drugId)
+                if screening.rejected:
+                    reason = next(alert for alert in screening.alerts if "금기" in alert)
+                    repairs.append(f"dropped node {node.id!r}: {reason}")
+                    continue
+                node = node.model_copy(update={"alert": self.alert(node.drugId)})
+            nodes.append(node)
+        meta = GraphMeta(repairs=graph.meta.repairs + repairs)
+        return fix_graph(SimulationGraph(nodes=nodes, edges=graph.edges, review=graph.review, meta=meta))
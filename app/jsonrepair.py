@@ -0,0 +1,137 @@
+# app/jsonrepair.py
+import orjson
+
+# Single-pass repair of the JSON defects the model actually produces, mostly
+# copied from the few-shot examples it was shown:
+#
+#   - a missing comma between two members or elements, e.g. after
+#     "drugType": "..." or after an "explain" object
+#   - a trailing comma before "}" or "]", and doubled commas
+#   - code fences or prose before the root value and anything after it
+#
+# repair() walks the text once from a candidate root, tracking only string
+# and nesting state, and returns the repaired text with the number of fixes
+# it made. Prose may itself contain brackets ("Here [is] it: {...}"), so up
+# to MAX_ROOT_CANDIDATES roots are tried: the first "{" or "[" (only "{" when
+# the caller expects an object), then the next one after the value it
+# closed, until one repairs into valid JSON. It does not try to complete
+# truncated output: a root that never closes ends the search, so an object
+# inside it is never taken for the answer and the caller's parse still
+# fails.
+SCALAR_CHARS = frozenset("0123456789+-.eEtruefalsnTRUEFALSN")
+MAX_ROOT_CANDIDATES = 4
+
+
+def repair(text, roots="{["):
+    # roots: the characters the root value may start with
+    first = None
+    start = _root_start(text, roots, 0)
+    for _ in range(MAX_ROOT_CANDIDATES):
+        if start < 0:
+            break
+        repaired, fixes, end = _repair_from(text, start)
+        if first is None:
+            first = repaired, fixes
+        try:
+            orjson.loads(repaired)
+        except orjson.JSONDecodeError:
+            if end is None:
+                break
+            start = _root_start(text, roots, end)
+            continue
+        return repaired, fixes
+    return first if first is not None else (text, 0)
+
+
+def _repair_from(text, start):
+    out = []
+    stack = []
+    fixes = 0
+    in_string = False
+    escape = False
+    in_scalar = False
+    # A complete value or key was just written and nothing has followed it
+    after_value = False
+    # Index in out of a comma not yet followed by a member or element
+    comma_at = -1
+
+    end = len(text)
+    closed = False
+    for index in range(start, len(text)):
+        ch = text[index]
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                after_value = True
+            continue
+
+        if in_scalar:
+            if ch in SCALAR_CHARS:
+                out.append(ch)
+                continue
+            in_scalar = False
+            after_value = True
+
+        if ch.isspace():
+            out.append(ch)
+            continue
+
+        if ch == ",":
+            if comma_at >= 0 or not after_value:
+                fixes += 1
+                continue
+            comma_at = len(out)
+            out.append(ch)
+            after_value = False
+            continue
+
+        if ch == ":":
+            out.append(ch)
+            after_value = False
+            continue
+
+        if ch in "}]":
+            if comma_at >= 0:
+                # Trailing comma; only whitespace was written after it
+                out[comma_at] = ""
+                comma_at = -1
+                fixes += 1
+            out.append(ch)
+            if stack:
+                stack.pop()
+            after_value = True
+            if not stack:
+                end = index + 1
+                closed = True
+                break
+            continue
+
+        # Start of a key or value
+        if after_value:
+            out.append(",")
+            fixes += 1
+        after_value = False
+        comma_at = -1
+        out.append(ch)
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        else:
+            in_scalar = True
+
+    if text[:start].strip() or text[end:].strip():
+        # Leading or trailing text was dropped
+        fixes += 1
+    # end: where the root value closed, None if it never did
+    return "".join(out), fixes, end if closed else None
+
+
+def _root_start(text, roots, begin):
+    starts = [index for index in (text.find(ch, begin) for ch in roots) if index >= 0]
+    return min(starts) if starts else -1
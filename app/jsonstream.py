@@ -0,0 +1,132 @@
+# app/jsonstream.py
+import json
+
+
+# Incremental scanner for the model's JSON object as it is being streamed.
+# feed() returns (key, raw_json) pairs for every top-level member as soon as
+# its value is syntactically complete. Members named in split_keys whose value
+# is an array are emitted element by element instead, so e.g. each graph node
+# can be sent before the whole "nodes" array has been generated.
+#
+# The scanner only tracks nesting and string state; it does not validate the
+# emitted text, and anything before the root "{" (code fences, prose) is
+# skipped.
+class IncrementalJSONParser:
+    def __init__(self, split_keys=()):
+        self.split_keys = frozenset(split_keys)
+        self.done = False
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_is_key = False
+        self._key_chars = []
+        self._key = None
+        self._expect_key = False
+        self._splitting = False
+        self._capture = None
+        self._capture_depth = 0
+        self._scalar = False
+
+    def feed(self, text):
+        events = []
+        for ch in text:
+            if self.done:
+                break
+            self._step(ch, events)
+        return events
+
+    def _step(self, ch, events):
+        if self._in_string:
+            self._string_char(ch, events)
+            return
+
+        if self._scalar:
+            if ch not in ",}]" and not ch.isspace():
+                self._capture.append(ch)
+                return
+            self._scalar = False
+            self._emit(events)
+
+        stack = self._stack
+        if not stack:
+            if ch == "{":
+                stack.append(ch)
+                self._expect_key = True
+            return
+
+        if self._capture is not None:
+            self._capture.append(ch)
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                stack.append(ch)
+            elif ch in "}]":
+                stack.pop()
+                if len(stack) == self._capture_depth:
+                    self._emit(events)
+            return
+
+        if ch.isspace() or ch in ",:":
+            if ch == "," and len(stack) == 1:
+                self._expect_key = True
+            return
+
+        depth = len(stack)
+        if depth == 1:
+            if ch == "}":
+                stack.pop()
+                self.done = True
+            elif self._expect_key:
+                if ch == '"':
+                    self._in_string = True
+                    self._string_is_key = True
+                    self._key_chars = []
+            elif ch == "[" and self._key in self.split_keys:
+                stack.append(ch)
+                self._splitting = True
+            else:
+                self._start_capture(ch)
+        elif depth == 2 and self._splitting:
+            if ch in "}]":
+                stack.pop()
+                self._splitting = False
+                self._expect_key = True
+            else:
+                self._start_capture(ch)
+
+    def _string_char(self, ch, events):
+        if self._capture is not None and not self._string_is_key:
+            self._capture.append(ch)
+        if self._escape:
+            self._escape = False
+        elif ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            if self._string_is_key:
+                self._string_is_key = False
+                self._key = json.loads('"' + "".join(self._key_chars) + '"')
+                self._expect_key = False
+                return
+            if len(self._stack) == self._capture_depth:
+                self._emit(events)
+            return
+        if self._string_is_key:
+            self._key_chars.append(ch)
+
+    def _start_capture(self, ch):
+        self._capture = [ch]
+        self._capture_depth = len(self._stack)
+        if ch == '"':
+            self._in_string = True
+        elif ch in "{[":
+            self._stack.append(ch)
+        else:
+            self._scalar = True
+
+    def _emit(self, events):
+        events.append((self._key, "".join(self._capture)))
+        self._capture = None
+        if len(self._stack) == 1:
+            # Also tolerates a missing comma between top-level members
+            self._expect_key = True
@@ -0,0 +1,148 @@
+# app/knowledge.py
+import logging
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import orjson
+
+from .models import (
+    Edge, GraphMeta, PatientInfo, Prescription, PrescriptionNode, Reaction, ReactionNode, SimulationGraph,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = Path(__file__).parent / "data" / "drug_kb.json"
+
+
+# Bundled drug / adverse-reaction knowledge base (app/data/drug_kb.json):
+#
+#   drugs:        ATC code -> Prescription fields + the reactions it can cause
+#   reactions:    label -> Reaction fields + ATC codes of drugs that treat it
+#   indications:  symptom keyword -> ATC codes to consider for it
+#
+# Everything is indexed into dicts once at load, so building a cascade is a
+# handful of dict lookups.
+class DrugKnowledgeBase:
+    def __init__(self, path=DEFAULT_PATH):
+        start = time.perf_counter()
+        data = orjson.loads(Path(path).read_bytes())
+        self.version = data["version"]
+        self.drugs: Dict[str, dict] = {drug["drugId"]: drug for drug in data["drugs"]}
+        self.reactions: Dict[str, dict] = {reaction["label"]: reaction for reaction in data["reactions"]}
+        self.indications = [(item["symptom"], item["drugs"]) for item in data["indications"]]
+        self.load_seconds = time.perf_counter() - start
+        logger.info("Loaded drug knowledge base v%s: %d drugs, %d reactions in %.1f ms",
+                    self.version, len(self.drugs), len(self.reactions), self.load_seconds * 1000)
+
+    def prescription(self, drug_id) -> Prescription:
+        drug = self.drugs[drug_id]
+        return Prescription(drugId=drug_id, drugType=drug["drugType"], labelKo=drug["labelKo"],
+                            labelEn=drug["labelEn"], efficacy=drug["efficacy"])
+
+    def reaction(self, label) -> Reaction:
+        reaction = self.reactions[label]
+        return Reaction(label=label, explain=reaction["explain"], alert=reaction["alert"])
+
+    def candidates_for(self, symptoms) -> List[str]:
+        # ATC codes for every indication keyword found in the symptom text,
+        # in knowledge base order
+        found = {}
+        for keyword, drug_ids in self.indications:
+            if keyword in symptoms:
+                for drug_id in drug_ids:
+                    found.setdefault(drug_id, None)
+        return list(found)
+
+
+def build_cascade(kb: DrugKnowledgeBase, patient_info: PatientInfo,
+                  allowed: Callable[[str], bool] = None) -> Optional[Dict[str, List[str]]]:
+    # Every candidate of the prescription1 -> reaction1 -> prescription2 ->
+    # reaction2 cascade, as tier -> ATC codes / reaction labels. Drugs failing
+    # allowed() (e.g. contraindicated for this patient) are left out. None
+    # when no symptom maps to an allowed drug; the caller then falls back to
+    # having the model generate the whole graph.
+    prescription1 = kb.candidates_for(patient_info.symptoms)
+    if allowed is not None:
+        prescription1 = [drug_id for drug_id in prescription1 if allowed(drug_id)]
+    if not prescription1:
+        return None
+    reaction1 = _unique(label for drug_id in prescription1 for label in kb.drugs[drug_id]["reactions"])
+    prescription2 = _unique(drug_id for label in reaction1 for drug_id in kb.reactions[label]["treatments"]
+                            if allowed is None or allowed(drug_id))
+    reaction2 = _unique(label for drug_id in prescription2 for label in kb.drugs[drug_id]["reactions"])
+    return {
+        "prescription1": prescription1,
+        "reaction1": reaction1,
+        "prescription2": prescription2,
+        "reaction2": reaction2,
+    }
+
+
+def _unique(values):
+    return list(dict.fromkeys(values))
+
+
+def describe_cascade(kb: DrugKnowledgeBase, cascade: Dict[str, List[str]],
+                     alert: Callable[[str], Optional[str]] = None) -> str:
+    # One line per candidate, addressed by the id the model ranks it with
+    lines = []
+    for tier, keys in cascade.items():
+        for i, key in enumerate(keys, 1):
+            if tier.startswith("prescription"):
+                drug = kb.drugs[key]
+                line = (f"{tier}-{i}: {drug['labelKo']} ({drug['labelEn']}, {key}, {drug['drugType']}) "
+                        f"- 효능: {', '.join(drug['efficacy'])} / 부작용: {', '.join(drug['reactions'])}")
+                warning = alert(key) if alert is not None else None
+                lines.append(f"{line} / 주의: {warning}" if warning else line)
+            else:
+                lines.append(f"{tier}-{i}: {key} ({kb.reactions[key]['explain'].get('발생 빈도', '')})")
+    return "\n".join(lines)
+
+
+def assemble_graph(kb: DrugKnowledgeBase, cascade: Dict[str, List[str]], ranking: Dict[str, List[str]],
+                   review: str, max_per_tier: int,
+                   alert: Callable[[str], Optional[str]] = None) -> SimulationGraph:
+    # Orders both prescription tiers by the model's ranking (unranked
+    # candidates keep their order after the ranked ones), keeps the top
+    # max_per_tier of each, and keeps only reactions reachable from the kept
+    # prescriptions. Ids are renumbered so they stay contiguous.
+    prescription1 = _ranked(cascade["prescription1"], "prescription1", ranking)[:max_per_tier]
+    reaction1 = _unique(label for drug_id in prescription1 for label in kb.drugs[drug_id]["reactions"])
+    treatments = {drug_id for label in reaction1 for drug_id in kb.reactions[label]["treatments"]}
+    prescription2 = [drug_id for drug_id in _ranked(cascade["prescription2"], "prescription2", ranking)
+                     if drug_id in treatments][:max_per_tier]
+    reaction2 = _unique(label for drug_id in prescription2 for label in kb.drugs[drug_id]["reactions"])
+
+    ids = {}
+    nodes = []
+    for tier, keys in (("prescription1", prescription1), ("reaction1", reaction1),
+                       ("prescription2", prescription2), ("reaction2", reaction2)):
+        for i, key in enumerate(keys, 1):
+            node_id = f"{tier}-{i}"
+            ids[tier, key] = node_id
+            if tier.startswith("prescription"):
+                nodes.append(PrescriptionNode(id=node_id, alert=alert(key) if alert is not None else None,
+                                              **kb.prescription(key).model_dump()))
+            else:
+                nodes.append(ReactionNode(id=node_id, **kb.reaction(key).model_dump()))
+
+    edges = []
+    for drug_tier, reaction_tier, drugs in (("prescription1", "reaction1", prescription1),
+                                            ("prescription2", "reaction2", prescription2)):
+        for drug_id in drugs:
+            for label in kb.drugs[drug_id]["reactions"]:
+                edges.append(Edge(source=ids[drug_tier, drug_id], to=ids[reaction_tier, label]))
+    for label in reaction1:
+        for drug_id in kb.reactions[label]["treatments"]:
+            if ("prescription2", drug_id) in ids:
+                edges.append(Edge(source=ids["reaction1", label], to=ids["prescription2", drug_id]))
+    return SimulationGraph(nodes=nodes, edges=edges, review=review, meta=GraphMeta())
+
+
+def _ranked(keys, tier, ranking):
+    # ranking holds candidate ids ("prescription1-3"); map them back to keys
+    position = {f"{tier}-{i}": key for i, key in enumerate(keys, 1)}
+    ordered = _unique(position[node_id] for node_id in ranking.get(tier, []) if node_id in position)
+    ranked = set(ordered)
+    return ordered + [key for key in keys if key not in ranked]
@@ -0,0 +1,261 @@
+# app/llm.py
+import logging
+import time
+
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from . import config, metrics
+from .resilience import OPEN, CircuitOpen, DeadlineExceeded, LocalDeadlineExceeded, Resilience, RetryBudget
+from .router import Router
+from .scheduler import BATCH, INTERACTIVE, PREFETCH, Scheduler
+
+# One pooled, keep-alive HTTP client shared by every endpoint. The pool is
+# bounded so a burst of simulations queues for a connection instead of
+# opening an unbounded number of sockets to the provider.
+http_client = DefaultAsyncHttpxClient(
+    limits=httpx.Limits(
+        max_connections=config.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=config.LLM_MAX_KEEPALIVE,
+        keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY,
+    ),
+)
+
+logger = logging.getLogger(__name__)
+
+client = AsyncOpenAI(
+    api_key=config.OPENAI_API_KEY,
+    base_url=config.OPENAI_BASE_URL,
+    timeout=config.LLM_TIMEOUT,
+    # Retries are made by the resilience layer, within its budget
+    max_retries=0,
+    http_client=http_client,
+)
+
+
+scheduler = Scheduler(
+    limits={
+        config.RESULT_MODEL: (config.RESULT_MODEL_RPM, config.RESULT_MODEL_TPM),
+        config.PATIENT_MODEL: (config.PATIENT_MODEL_RPM, config.PATIENT_MODEL_TPM),
+    },
+    slo={
+        INTERACTIVE: config.SCHEDULER_SLO_INTERACTIVE,
+        BATCH: config.SCHEDULER_SLO_BATCH,
+        PREFETCH: config.SCHEDULER_SLO_PREFETCH,
+    },
+    max_in_flight=config.LLM_MAX_IN_FLIGHT,
+    weights=config.TENANT_WEIGHTS,
+    caps=config.TENANT_CONCURRENCY,
+    default_cap=config.TENANT_DEFAULT_CONCURRENCY,
+)
+
+resilience = Resilience(
+    attempts=config.LLM_MAX_ATTEMPTS,
+    backoff_base=config.LLM_RETRY_BACKOFF,
+    backoff_max=config.LLM_RETRY_BACKOFF_MAX,
+    budget=RetryBudget(ratio=config.LLM_RETRY_BUDGET_RATIO, min_per_second=config.LLM_RETRY_BUDGET_MIN_PER_SEC),
+    hedge=config.LLM_HEDGE,
+    hedge_quantile=config.LLM_HEDGE_QUANTILE,
+    hedge_min_delay=config.LLM_HEDGE_MIN_DELAY,
+    breaker={
+        "window": config.BREAKER_WINDOW,
+        "min_calls": config.BREAKER_MIN_CALLS,
+        "failure_ratio": config.BREAKER_FAILURE_RATIO,
+        "cooldown": config.BREAKER_COOLDOWN,
+    },
+)
+
+
+router = Router(
+    routes={"result": config.ROUTE_RESULT, "patient": config.ROUTE_PATIENT},
+    circuit_open=lambda model: resilience.health(model).breaker.state == OPEN,
+    latency_slo=config.ROUTE_LATENCY_SLO,
+    max_error_rate=config.ROUTER_MAX_ERROR_RATE,
+    min_samples=config.ROUTER_MIN_SAMPLES,
+    max_prompt_tokens=config.MODEL_MAX_PROMPT_TOKENS,
+    prices=config.MODEL_PRICES,
+    budget_per_hour=config.ROUTER_BUDGET_PER_HOUR,
+    fastest=config.ROUTE_FASTEST_EXPLAIN_TYPES,
+    probe_ratio=config.ROUTER_PROBE_RATIO,
+)
+
+# Failures that count against a model on its route; shedding, an open
+# breaker and a deadline spent in our own queue say nothing new about it
+MODEL_FAILURES = (openai.APIError, DeadlineExceeded)
+
+
+def _model_failure(error):
+    return isinstance(error, MODEL_FAILURES) and not isinstance(error, LocalDeadlineExceeded)
+
+
+def _prompt_chars(messages):
+    return sum(len(message["content"]) for message in messages)
+
+
+def prompt_tokens(messages):
+    return int(_prompt_chars(messages) / config.LLM_CHARS_PER_TOKEN)
+
+
+def estimate_tokens(messages):
+    return prompt_tokens(messages) + config.LLM_COMPLETION_TOKENS_ESTIMATE
+
+
+def choose(route, messages, explain_type=None):
+    return router.choose(route, prompt_tokens(messages), explain_type)
+
+
+def _timeout(left):
+    return config.LLM_TIMEOUT if left is None else min(left, config.LLM_TIMEOUT)
+
+
+def admit(model, messages):
+    # Raises Overloaded now rather than once a streamed response has started
+    scheduler.check(model, estimate_tokens(messages))
+
+
+def _report_usage(model, messages, usage):
+    # Cached tokens show whether the static prompt prefix hit the provider's
+    # prompt cache; a steady zero means something dynamic crept into it.
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    metrics.llm_prompt_tokens.inc(model, amount=usage.prompt_tokens)
+    metrics.llm_cached_tokens.inc(model, amount=cached)
+    metrics.llm_completion_tokens.inc(model, amount=usage.completion_tokens)
+    logger.info(
+        "%s prompt: %d chars, %d tokens (%d cached), completion: %d tokens",
+        model, _prompt_chars(messages), usage.prompt_tokens, cached, usage.completion_tokens,
+    )
+
+
+class _Slot:
+    # A scheduler slot for one attempt. Every attempt, hedged duplicates
+    # included, is scheduled on its own; the resilience layer waits for the
+    # slot outside the attempt's timing.
+    def __init__(self, model, cost):
+        self.model = model
+        self.cost = cost
+
+    async def acquire(self):
+        return await scheduler.acquire(self.model, self.cost), time.perf_counter()
+
+    def release(self, token):
+        tenant, granted = token
+        scheduler.release(tenant, time.perf_counter() - granted)
+
+
+async def complete(model, messages, route=None, **kwargs):
+    # route: the router route the model was chosen for, which is told how
+    # the call went
+    cost = estimate_tokens(messages)
+    latency = None
+
+    async def attempt(left):
+        nonlocal latency
+        metrics.llm_in_flight.inc(model)
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await client.chat.completions.create(
+                model=model, messages=messages, timeout=_timeout(left), **kwargs
+            )
+            outcome = "ok"
+            latency = time.perf_counter() - start
+        finally:
+            metrics.llm_in_flight.dec(model)
+            metrics.llm_latency.observe(model, "complete", value=time.perf_counter() - start)
+            metrics.llm_requests.inc(model, outcome)
+        _report_usage(model, messages, response.usage)
+        if response.usage is not None:
+            scheduler.settle(model, cost, response.usage.total_tokens)
+        return response
+
+    try:
+        response = await resilience.call(model, attempt, slot=_Slot(model, cost))
+    except MODEL_FAILURES as e:
+        if route is not None and _model_failure(e):
+            router.observe(route, model, False)
+        raise
+    if route is not None:
+        router.observe(route, model, True, latency)
+        if response.usage is not None:
+            router.charge(route, model, response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response
+
+
+async def routed(route, messages, explain_type=None, **kwargs):
+    # complete() on the model the router picks for route
+    model = choose(route, messages, explain_type)
+    try:
+        return await complete(model, messages, route=route, **kwargs)
+    except CircuitOpen:
+        # The breaker opened after the pick, e.g. under calls made at the
+        # same time; another candidate may still be healthy
+        fallback = choose(route, messages, explain_type)
+        if fallback == model:
+            raise
+        return await complete(fallback, messages, route=route, **kwargs)
+
+
+async def aclose():
+    await client.close()
+
+
+async def stream(model, messages, route=None, **kwargs):
+    # Yields the text deltas of a streamed completion
+    cost = estimate_tokens(messages)
+    tenant = await scheduler.acquire(model, cost)
+    metrics.llm_in_flight.inc(model)
+    start = time.perf_counter()
+    first = True
+    outcome = "error"
+    try:
+        # Retried only until the response starts; not hedged, and its time
+        # to headers is not a completion latency
+        try:
+            response = await resilience.call(
+                model,
+                lambda left: client.chat.completions.create(
+                    model=model, messages=messages, stream=True,
+                    stream_options={"include_usage": True}, timeout=_timeout(left), **kwargs
+                ),
+                hedge=False, timed=False,
+            )
+        except MODEL_FAILURES as e:
+            if route is not None and _model_failure(e):
+                router.observe(route, model, False)
+            raise
+        try:
+            async for chunk in response:
+                if chunk.usage is not None:
+                    _report_usage(model, messages, chunk.usage)
+                    scheduler.settle(model, cost, chunk.usage.total_tokens)
+                    if route is not None:
+                        router.charge(route, model, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first:
+                        first = False
+                        metrics.llm_first_token.observe(model, value=time.perf_counter() - start)
+                    yield chunk.choices[0].delta.content
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        except Exception:
+            # Broke off partway through
+            if route is not None:
+                router.observe(route, model, False)
+            raise
+        finally:
+            await response.close()
+        if route is not None:
+            # The whole answer's time, as for complete(), so the route's p95
+            # compares to its SLO either way
+            router.observe(route, model, True, time.perf_counter() - start)
+    finally:
+        scheduler.release(tenant, time.perf_counter() - start)
+        metrics.llm_in_flight.dec(model)
+        metrics.llm_latency.observe(model, "stream", value=time.perf_counter() - start)
+        metrics.llm_requests.inc(model, outcome)
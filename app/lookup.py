@@ -0,0 +1,52 @@
+# app/lookup.py
+import logging
+import time
+from bisect import bisect_left, bisect_right
+from typing import List
+
+from .knowledge import DrugKnowledgeBase
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text) -> str:
+    return "".join(text.split()).lower()
+
+
+# Type-ahead index over the knowledge base drugs. Every drug is reachable by
+# its ATC code, Korean label and English label; the normalized keys are kept
+# in one sorted array, so all keys starting with a prefix are a contiguous
+# slice found with two binary searches. An ATC group ("N02", "c09a") is a
+# prefix of its codes, so it lists the whole group.
+class DrugIndex:
+    def __init__(self, kb: DrugKnowledgeBase):
+        start = time.perf_counter()
+        self.version = kb.version
+        self._records = {drug_id: kb.prescription(drug_id).model_dump() for drug_id in kb.drugs}
+        entries = sorted({
+            (normalize(key), drug_id)
+            for drug_id, drug in kb.drugs.items()
+            for key in (drug_id, drug["labelKo"], drug["labelEn"])
+        })
+        self._keys = [key for key, _ in entries]
+        self._drug_ids = [drug_id for _, drug_id in entries]
+        self.load_seconds = time.perf_counter() - start
+        logger.info("Built drug lookup index: %d keys in %.2f ms", len(self._keys), self.load_seconds * 1000)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, query, limit=10) -> List[dict]:
+        # Prescription records whose code or label starts with query; exact
+        # and shorter keys sort first
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_right(self._keys, prefix + "\uffff", lo)
+        found = {}
+        for drug_id in self._drug_ids[lo:hi]:
+            found.setdefault(drug_id, None)
+            if len(found) == limit:
+                break
+        return [self._records[drug_id] for drug_id in found]
@@ -0,0 +1,241 @@
+# app/metrics.py
+import bisect
+import time
+
+# Minimal Prometheus text-format metrics. Everything is updated from the
+# event loop thread only, so the hot path is a dict lookup and an add with
+# no locking; rendering happens on scrape.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values = {}
+
+    def samples(self):
+        return dict(self._values)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, *labels, value):
+        self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value):
+        state = self._values.get(labels)
+        if state is None:
+            # per-bucket counts (made cumulative on render), sum, count
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = _labels(self.labelnames, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            suffix = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_number(total)}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class Callback(_Metric):
+    # Value read from another component at scrape time, e.g. cache counters
+
+    def __init__(self, name, help, type, fn, labels=()):
+        super().__init__(name, help, labels)
+        self.type = type
+        self.fn = fn
+
+    def render(self):
+        self._values = dict(self.fn())
+        return super().render()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, type, fn, labels=()):
+        return self.register(Callback(name, help, type, fn, labels))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+http_requests = REGISTRY.counter(
+    "http_requests_total", "HTTP requests handled.", ("endpoint", "method", "status"))
+http_latency = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency, including streamed bodies.", ("endpoint",))
+http_in_flight = REGISTRY.gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled.", ("endpoint",))
+
+llm_requests = REGISTRY.counter(
+    "llm_requests_total", "Upstream completion calls.", ("model", "outcome"))
+llm_latency = REGISTRY.histogram(
+    "llm_request_duration_seconds", "Upstream completion latency.", ("model", "mode"))
+llm_first_token = REGISTRY.histogram(
+    "llm_time_to_first_token_seconds", "Time until the first streamed delta.", ("model",))
+llm_in_flight = REGISTRY.gauge(
+    "llm_requests_in_flight", "Upstream completion calls currently open.", ("model",))
+llm_prompt_tokens = REGISTRY.counter(
+    "llm_prompt_tokens_total", "Prompt tokens reported in completion usage.", ("model",))
+llm_cached_tokens = REGISTRY.counter(
+    "llm_cached_prompt_tokens_total", "Prompt tokens served from the provider prompt cache.", ("model",))
+llm_completion_tokens = REGISTRY.counter(
+    "llm_completion_tokens_total", "Completion tokens reported in completion usage.", ("model",))
+llm_retries = REGISTRY.counter(
+    "llm_retries_total", "Upstream attempts retried, by the error that caused the retry.", ("model", "error"))
+llm_hedges = REGISTRY.counter(
+    "llm_hedges_total", "Hedged duplicate attempts: sent, and won (answered before the original).",
+    ("model", "outcome"))
+stale_served = REGISTRY.counter(
+    "response_cache_stale_served_total", "Expired cache entries served because the upstream failed.", ("cache",))
+scheduler_wait = REGISTRY.histogram(
+    "llm_scheduler_wait_seconds", "Time completion calls waited for rate limit capacity.", ("model", "priority"))
+scheduler_shed = REGISTRY.counter(
+    "llm_scheduler_shed_total", "Completion calls refused because their queueing time would exceed the SLO.",
+    ("model", "priority"))
+tenant_wait = REGISTRY.histogram(
+    "tenant_queue_wait_seconds", "Time a tenant's completion calls waited in the scheduler.", ("tenant",))
+tenant_tokens = REGISTRY.counter(
+    "tenant_granted_tokens_total", "Estimated tokens of the completion calls granted to a tenant.", ("tenant",))
+route_decisions = REGISTRY.counter(
+    "llm_route_decisions_total",
+    "Models picked per route, by reason: primary, prompt_size, circuit, errors, latency, budget, fastest.",
+    ("route", "model", "reason"))
+route_latency = REGISTRY.histogram(
+    "llm_route_latency_seconds", "Latency of successful completion calls per route and model.", ("route", "model"))
+route_errors = REGISTRY.counter(
+    "llm_route_errors_total", "Failed completion calls per route and model.", ("route", "model"))
+route_cost = REGISTRY.counter(
+    "llm_route_cost_dollars_total", "Estimated upstream spend per route and model, from MODEL_PRICES.",
+    ("route", "model"))
+result_paths = REGISTRY.counter(
+    "simulation_result_path_total",
+    "Result graphs by how they were built: knowledge_base (model only ranks) or generated.", ("path",))
+drug_screenings = REGISTRY.counter(
+    "drug_screenings_total", "Prescriptions screened against a patient's medications and allergies.", ("outcome",))
+graph_repairs = REGISTRY.counter(
+    "graph_repairs_total", "Fixes applied to generated graphs, by action (dropped, reversed).", ("action",))
+prefetch_jobs = REGISTRY.counter(
+    "prefetch_jobs_total",
+    "Background prefetch jobs by outcome: queued, dropped (queue full), done, failed, expired, cancelled.",
+    ("outcome",))
+llm_output_json = REGISTRY.counter(
+    "llm_output_json_total",
+    "Model outputs by JSON outcome: clean, repaired locally, or failed (a retry is needed).",
+    ("kind", "outcome"))
+
+
+# Pure ASGI middleware (no BaseHTTPMiddleware) so streamed responses are not
+# buffered and the per-request overhead stays a couple of dict updates.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._paths = None
+
+    def _endpoint(self, scope):
+        if self._paths is None:
+            self._paths = {route.path for route in scope["app"].routes if hasattr(route, "path")}
+        path = scope["path"]
+        return path if path in self._paths else "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._endpoint(scope)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        http_in_flight.inc(endpoint)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec(endpoint)
+            http_latency.observe(endpoint, value=time.perf_counter() - start)
+            http_requests.inc(endpoint, scope["method"], str(status[0]))
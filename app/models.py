@@ -0,0 +1,133 @@
+# app/models.py
+from pydantic import BaseModel, ConfigDict, Discriminator, Field, Tag
+from typing import Annotated, Any, Dict, List, Optional, Union
+
+class Prescription(BaseModel):
+    drugId: str
+    drugType: str
+    labelKo: str
+    labelEn: str
+    efficacy: List[str]
+
+class Reaction(BaseModel):
+    label: str
+    explain: Dict[str, str]
+    alert: str
+
+class PatientScenario(BaseModel):
+    prescription1: List[Prescription]
+    reaction1: List[Reaction]
+    prescription2: List[Prescription]
+    reaction2: List[Reaction]
+
+class PatientInfo(BaseModel):
+    name: str
+    birthdate: str
+    sex: str
+    weight: int
+    height: int
+    bloodPressure: str
+    pastDiseases: str
+    currentMedications: str
+    allergies: str
+    familyHistory: str
+    symptoms: str
+    onset: str
+    painLevel: int
+
+class SimulateResult(BaseModel):
+    name: str
+    birthdate: str
+    sex: str
+    weight: int
+    height: int
+    bloodPressure: str
+    pastDiseases: str
+    currentMedications: str
+    allergies: str
+    familyHistory: str
+    symptoms: str
+    onset: str
+    painLevel: int
+    explainType: int
+    scenario: PatientScenario
+
+class SessionSimulateResult(BaseModel):
+    # /simulation/patient/ by reference: the graph id /simulation/result/
+    # returned and the ids of the chosen nodes, e.g. ["prescription1-1",
+    # "reaction1-2", ...]
+    graphId: str
+    nodeIds: List[str]
+    explainType: int
+
+
+# Response models. The model output is parsed once into these and served as
+# JSON objects instead of a JSON string wrapped in a one-element array.
+
+class PrescriptionNode(Prescription):
+    id: str
+    # Interaction / allergy warnings against the patient's current
+    # medications, set by app.interactions
+    alert: Optional[str] = None
+
+class ReactionNode(Reaction):
+    id: str
+
+def _node_kind(node):
+    # Picks the node class up front instead of trying both union members
+    if isinstance(node, dict):
+        return "prescription" if "drugId" in node else "reaction"
+    return "prescription" if isinstance(node, Prescription) else "reaction"
+
+Node = Annotated[
+    Union[Annotated[PrescriptionNode, Tag("prescription")], Annotated[ReactionNode, Tag("reaction")]],
+    Discriminator(_node_kind),
+]
+
+class Edge(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    source: str = Field(alias="from")
+    to: str
+
+class GraphMeta(BaseModel):
+    # What app.graph.fix_graph changed in the model's graph, if anything
+    repairs: List[str] = []
+
+class SimulationGraph(BaseModel):
+    nodes: List[Node]
+    edges: List[Edge]
+    review: str
+    meta: GraphMeta = Field(default_factory=GraphMeta)
+
+class SessionGraph(SimulationGraph):
+    # /simulation/result/ response: the graph plus the id to reference it by
+    graphId: str
+
+class CascadeRanking(BaseModel):
+    # Model output on the knowledge base path: candidate ids best first
+    ranking: Dict[str, List[str]] = {}
+    review: str
+
+class PatientExplanation(BaseModel):
+    prescription1: List[Dict[str, Any]]
+    reaction1: List[Dict[str, Any]]
+    prescription2: List[Dict[str, Any]]
+    reaction2: List[Dict[str, Any]]
+    totalResult: List[Dict[str, Any]]
+
+class PatientFeatures(BaseModel):
+    # What a per-item explanation is allowed to depend on (and is cached by)
+    sex: str
+    ageGroup: str
+    pastDiseases: str
+    # Drug classes of the current medications and allergies (app/interactions.py)
+    currentMedications: str
+    allergies: str
+
+class ExplanationFragment(BaseModel):
+    # One prescription's or reaction's entries of a PatientExplanation section
+    items: List[Dict[str, Any]]
+
+class ExplanationTotal(BaseModel):
+    totalResult: List[Dict[str, Any]]
@@ -0,0 +1,378 @@
+# app/offline.py
+# Offline re-simulation through the provider Batch API. Requests are built
+# with the same prompt builders as the live endpoints and keyed with the same
+# canonical cache keys, so once a batch is ingested into the on-disk response
+# cache the live endpoints serve those patients without an upstream call.
+#
+#   python -m app.offline run --kind result patients.jsonl --wait
+#   python -m app.offline write --kind patient scenarios.json
+#   python -m app.offline submit 3
+#   python -m app.offline poll
+#   python -m app.offline ingest
+#   python -m app.offline list
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from . import config, prompts
+from .cache import ResponseCache, canonical_key
+from .interactions import InteractionEngine
+from .knowledge import DrugKnowledgeBase, assemble_graph, build_cascade, describe_cascade
+from .models import PatientInfo, SimulateResult
+from .responses import MalformedModelOutput, dump, parse_explanation, parse_graph, parse_ranking
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Provider limit on requests per batch input file
+MAX_REQUESTS_PER_BATCH = 50000
+ACTIVE_STATUSES = ("submitted", "validating", "in_progress", "finalizing", "cancelling")
+DONE_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+KINDS = {
+    "result": (PatientInfo, config.RESULT_MODEL),
+    "patient": (SimulateResult, config.PATIENT_MODEL),
+}
+# Same response_format as the live endpoints
+JSON_MODE = {"type": "json_object"}
+
+
+_interaction_engine = None
+_drug_kb = None
+
+
+def interaction_engine():
+    global _interaction_engine
+    if _interaction_engine is None and config.INTERACTIONS_PATH:
+        _interaction_engine = InteractionEngine(config.INTERACTIONS_PATH)
+    return _interaction_engine
+
+
+def drug_kb():
+    global _drug_kb
+    if _drug_kb is None and config.DRUG_KB_PATH:
+        _drug_kb = DrugKnowledgeBase(config.DRUG_KB_PATH)
+    return _drug_kb
+
+
+def result_plan(patient_info: PatientInfo):
+    # (key parts, messages, render) of the path /simulation/result/ takes for
+    # this patient: a ranking of the knowledge base cascade when it matches,
+    # a generated graph otherwise. Must match main.run_simulate_result and
+    # main.result_cache_key.
+    engine = interaction_engine()
+    kb = drug_kb()
+    screen = engine.screener(patient_info) if engine is not None else None
+    screening = engine.version if engine is not None else "off"
+    cascade = build_cascade(kb, patient_info, screen.allowed if screen is not None else None) if kb else None
+    if cascade is None:
+        def render_graph(content):
+            graph = parse_graph(content)
+            return dump(screen.annotate(graph) if screen is not None else graph)
+
+        return (prompts.RESULT_PROMPT_VERSION, screening), prompts.result_messages(patient_info), render_graph
+
+    alert = screen.alert if screen is not None else None
+
+    def render_ranking(content):
+        ranking = parse_ranking(content)
+        return dump(assemble_graph(kb, cascade, ranking.ranking, ranking.review, config.DRUG_KB_MAX_PER_TIER, alert))
+
+    messages = prompts.ranking_messages(patient_info, describe_cascade(kb, cascade, alert))
+    return (prompts.RANKING_PROMPT_VERSION, kb.version, screening), messages, render_ranking
+
+
+def plan(kind, payload):
+    if kind == "result":
+        return result_plan(payload)
+    return (
+        (prompts.PATIENT_PROMPT_VERSION,), prompts.patient_messages(payload),
+        lambda content: dump(parse_explanation(content)),
+    )
+
+
+def render(kind, body, content):
+    if body is None:
+        if kind == "result" and (interaction_engine() is not None or drug_kb() is not None):
+            raise MalformedModelOutput("request body was not stored with this job")
+        return dump(parse_graph(content) if kind == "result" else parse_explanation(content))
+    return plan(kind, KINDS[kind][0](**body))[2](content)
+
+
+def cache_for(kind):
+    db_path = config.RESULT_CACHE_DB if kind == "result" else config.PATIENT_CACHE_DB
+    ttl = config.RESULT_CACHE_TTL if kind == "result" else config.PATIENT_CACHE_TTL
+    if not db_path:
+        # An in-memory tier would vanish with this process
+        variable = "RESULT_CACHE_DB" if kind == "result" else "PATIENT_CACHE_DB"
+        raise SystemExit(f"{variable} must point at the server's SQLite cache to ingest batch results")
+    return ResponseCache(ttl=ttl, db_path=db_path, stale_grace=config.CACHE_STALE_GRACE,
+                         cleanup_interval=config.CACHE_CLEANUP_INTERVAL)
+
+
+class JobStore:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS batch_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                input_path TEXT NOT NULL,
+                request_count INTEGER NOT NULL,
+                batch_id TEXT,
+                input_file_id TEXT,
+                output_file_id TEXT,
+                error_file_id TEXT,
+                ingested_count INTEGER NOT NULL DEFAULT 0,
+                failed_count INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS batch_items (
+                job_id INTEGER NOT NULL REFERENCES batch_jobs(id),
+                custom_id TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                payload TEXT,
+                PRIMARY KEY (job_id, custom_id)
+            );
+            """
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(batch_items)")}
+        if "payload" not in columns:
+            # Stores created before request bodies were kept
+            self._conn.execute("ALTER TABLE batch_items ADD COLUMN payload TEXT")
+
+    def create(self, kind, input_path, items):
+        now = time.time()
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO batch_jobs (kind, status, input_path, request_count, created_at, updated_at)"
+                " VALUES (?, 'written', ?, ?, ?, ?)",
+                (kind, str(input_path), len(items), now, now),
+            )
+            job_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO batch_items (job_id, custom_id, cache_key, payload) VALUES (?, ?, ?, ?)",
+                [(job_id, custom_id, key, json.dumps(body, ensure_ascii=False))
+                 for custom_id, (key, body) in items.items()],
+            )
+        return job_id
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._conn:
+            self._conn.execute(
+                f"UPDATE batch_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+            )
+
+    def get(self, job_id):
+        row = self._conn.execute("SELECT * FROM batch_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise SystemExit(f"No batch job {job_id}")
+        return row
+
+    def jobs(self, statuses=None):
+        if statuses is None:
+            return self._conn.execute("SELECT * FROM batch_jobs ORDER BY id").fetchall()
+        placeholders = ", ".join("?" for _ in statuses)
+        return self._conn.execute(
+            f"SELECT * FROM batch_jobs WHERE status IN ({placeholders}) ORDER BY id", tuple(statuses)
+        ).fetchall()
+
+    def items(self, job_id):
+        # custom_id -> (cache key, request body or None for older jobs)
+        rows = self._conn.execute(
+            "SELECT custom_id, cache_key, payload FROM batch_items WHERE job_id = ?", (job_id,)
+        ).fetchall()
+        return {
+            row["custom_id"]: (row["cache_key"], json.loads(row["payload"]) if row["payload"] else None)
+            for row in rows
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+def read_payloads(path):
+    # Either a JSON array of request bodies or one body per line
+    text = Path(path).read_text(encoding="utf-8").strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+async def write_job(store, kind, input_path, skip_cached=True):
+    model_class, model = KINDS[kind]
+    cache = cache_for(kind) if skip_cached else None
+    lines, items = [], {}
+    for body in read_payloads(input_path):
+        payload = model_class(**body)
+        key_parts, messages, _ = plan(kind, payload)
+        key = canonical_key(payload, model, *key_parts)
+        custom_id = f"{kind}-{key}"
+        if custom_id in items:
+            continue
+        if cache is not None and await cache.get(key) is not None:
+            continue
+        items[custom_id] = (key, payload.model_dump())
+        lines.append(json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {"model": model, "messages": messages, "response_format": JSON_MODE},
+        }, ensure_ascii=False))
+    if cache is not None:
+        cache.close()
+
+    if not lines:
+        print("Every request is already cached; nothing to write")
+        return None
+    if len(lines) > MAX_REQUESTS_PER_BATCH:
+        raise SystemExit(f"{len(lines)} requests exceed the {MAX_REQUESTS_PER_BATCH} per-batch limit; split the input")
+
+    work_dir = Path(config.OFFLINE_WORK_DIR)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    batch_path = work_dir / f"{kind}-{int(time.time() * 1000)}.jsonl"
+    batch_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    job_id = store.create(kind, batch_path, items)
+    print(f"Job {job_id}: wrote {len(lines)} {kind} requests to {batch_path}")
+    return job_id
+
+
+async def submit_job(store, client, job_id):
+    job = store.get(job_id)
+    if job["status"] != "written":
+        raise SystemExit(f"Job {job_id} is already {job['status']}")
+    with open(job["input_path"], "rb") as f:
+        uploaded = await client.files.create(file=f, purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+        metadata={"job": str(job_id), "kind": job["kind"]},
+    )
+    store.update(job_id, status="submitted", batch_id=batch.id, input_file_id=uploaded.id)
+    print(f"Job {job_id}: submitted as {batch.id}")
+
+
+async def poll_job(store, client, job_id):
+    job = store.get(job_id)
+    batch = await client.batches.retrieve(job["batch_id"])
+    store.update(
+        job_id,
+        status=batch.status,
+        output_file_id=batch.output_file_id,
+        error_file_id=batch.error_file_id,
+    )
+    counts = batch.request_counts
+    progress = f" ({counts.completed}/{counts.total} done, {counts.failed} failed)" if counts else ""
+    print(f"Job {job_id}: {batch.status}{progress}")
+    return batch.status
+
+
+async def ingest_job(store, client, job_id):
+    job = store.get(job_id)
+    if job["status"] not in DONE_STATUSES:
+        raise SystemExit(f"Job {job_id} is still {job['status']}")
+    items = store.items(job_id)
+    cache = cache_for(job["kind"])
+    ingested = failed = 0
+    try:
+        if job["output_file_id"]:
+            output = await client.files.content(job["output_file_id"])
+            for line in output.text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                key, body = items.get(record.get("custom_id"), (None, None))
+                response = record.get("response") or {}
+                content = None
+                if key and response.get("status_code") == 200:
+                    choices = response["body"].get("choices") or []
+                    content = choices[0]["message"].get("content") if choices else None
+                try:
+                    if not content:
+                        raise MalformedModelOutput("empty batch response")
+                    # Stored in the same normalized form the live endpoints cache
+                    await cache.set(key, render(job["kind"], body, content))
+                    ingested += 1
+                except MalformedModelOutput:
+                    failed += 1
+        if job["error_file_id"]:
+            errors = await client.files.content(job["error_file_id"])
+            failed += sum(1 for line in errors.text.splitlines() if line.strip())
+    finally:
+        cache.close()
+    store.update(job_id, status="ingested", ingested_count=ingested, failed_count=failed)
+    print(f"Job {job_id}: ingested {ingested} responses into the {job['kind']} cache, {failed} failed")
+
+
+def print_jobs(store):
+    for job in store.jobs():
+        print(f"{job['id']:>4}  {job['kind']:<8} {job['status']:<12} {job['request_count']:>6} requests  "
+              f"batch={job['batch_id'] or '-'}  ingested={job['ingested_count']} failed={job['failed_count']}")
+
+
+async def run_command(args):
+    from .llm import client
+
+    store = JobStore(config.OFFLINE_JOBS_DB)
+    try:
+        if args.command == "list":
+            print_jobs(store)
+        elif args.command == "write":
+            await write_job(store, args.kind, args.input, skip_cached=not args.include_cached)
+        elif args.command == "submit":
+            await submit_job(store, client, args.job)
+        elif args.command == "poll":
+            job_ids = [args.job] if args.job else [job["id"] for job in store.jobs(ACTIVE_STATUSES)]
+            for job_id in job_ids:
+                await poll_job(store, client, job_id)
+        elif args.command == "ingest":
+            job_ids = [args.job] if args.job else [job["id"] for job in store.jobs(DONE_STATUSES)]
+            for job_id in job_ids:
+                await ingest_job(store, client, job_id)
+        elif args.command == "run":
+            job_id = await write_job(store, args.kind, args.input, skip_cached=not args.include_cached)
+            if job_id is None:
+                return
+            await submit_job(store, client, job_id)
+            if not args.wait:
+                return
+            while await poll_job(store, client, job_id) not in DONE_STATUSES:
+                await asyncio.sleep(args.poll_interval)
+            await ingest_job(store, client, job_id)
+    finally:
+        store.close()
+        await client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.offline", description="Offline Batch API re-simulation")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("write", "run"):
+        command = commands.add_parser(name)
+        command.add_argument("--kind", choices=sorted(KINDS), required=True)
+        command.add_argument("input", help="JSON array or JSONL file of request bodies")
+        command.add_argument("--include-cached", action="store_true",
+                             help="also resubmit inputs that already have a cached response")
+        if name == "run":
+            command.add_argument("--wait", action="store_true", help="poll until done, then ingest")
+            command.add_argument("--poll-interval", type=float, default=config.OFFLINE_POLL_INTERVAL)
+    commands.add_parser("submit").add_argument("job", type=int)
+    commands.add_parser("poll").add_argument("job", type=int, nargs="?")
+    commands.add_parser("ingest").add_argument("job", type=int, nargs="?")
+    commands.add_parser("list")
+
+    asyncio.run(run_command(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# app/prefetch.py
+import asyncio
+import logging
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# Background warm-up of work a client is likely to ask for next. Jobs are
+# (key, coroutine function) pairs run by a fixed number of workers from a
+# bounded queue:
+#
+#   - a key already queued or running is not queued again (unless its group
+#     was cancelled since)
+#   - when the queue is full new jobs are dropped, never the caller delayed
+#   - jobs older than max_age when a worker gets to them are skipped
+#   - workers wait while busy() says interactive traffic needs the upstream
+#   - cancel(group) drops the queued jobs of a group and cancels its running
+#     ones; stop() cancels everything
+class Prefetcher:
+    def __init__(self, workers, max_queue, max_age, busy=None, pause=0.1):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_age = max_age
+        self.busy = busy
+        self.pause = pause
+        self.running = 0
+        self._queue = None
+        # key -> the job queued or running for it
+        self._jobs = {}
+        # group -> times cancelled; a job queued before the last cancel is skipped
+        self._cancels = {}
+        self._current = {}
+        self._tasks = []
+
+    def start(self):
+        # Created here, not in __init__, so it belongs to the server's loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._jobs.clear()
+
+    def submit(self, key, fn, group=None) -> bool:
+        if not self._tasks:
+            return False
+        job = (key, fn, group, self._cancels.get(group, 0), time.monotonic())
+        current = self._jobs.get(key)
+        if current is not None and not self._stale(current):
+            return False
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.prefetch_jobs.inc("dropped")
+            return False
+        self._jobs[key] = job
+        metrics.prefetch_jobs.inc("queued")
+        return True
+
+    def cancel(self, group):
+        # Queued jobs of the group are skipped when they come up
+        self._cancels[group] = self._cancels.get(group, 0) + 1
+        for task, task_group in list(self._current.items()):
+            if task_group == group:
+                task.cancel()
+
+    def _stale(self, job):
+        _, _, group, cancels, _ = job
+        return self._cancels.get(group, 0) != cancels
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            key = job[0]
+            try:
+                await self._run(job)
+            finally:
+                if self._jobs.get(key) is job:
+                    del self._jobs[key]
+                if not self._jobs:
+                    # Nothing queued or running still holds an old count
+                    self._cancels.clear()
+
+    async def _run(self, job):
+        _, fn, group, _, queued_at = job
+        while self.busy is not None and self.busy():
+            await asyncio.sleep(self.pause)
+        if self._stale(job):
+            metrics.prefetch_jobs.inc("cancelled")
+            return
+        if time.monotonic() - queued_at > self.max_age:
+            metrics.prefetch_jobs.inc("expired")
+            return
+
+        task = asyncio.ensure_future(fn())
+        self._current[task] = group
+        self.running += 1
+        try:
+            await task
+            metrics.prefetch_jobs.inc("done")
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                # The worker itself is being stopped
+                raise
+            metrics.prefetch_jobs.inc("cancelled")
+        except Exception as e:
+            metrics.prefetch_jobs.inc("failed")
+            logger.info("Prefetch failed: %r", e)
+        finally:
+            self.running -= 1
+            del self._current[task]
+
+    def stats(self):
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return {"queued": queued, "running": self.running, "workers": len(self._tasks)}
@@ -0,0 +1,298 @@
+# app/resilience.py
+import asyncio
+import contextvars
+import itertools
+import math
+import random
+import time
+from collections import deque
+
+import openai
+
+from . import metrics
+
+# Absolute time.monotonic() by which the current request wants its answer,
+# set per endpoint and inherited by every task the request spawns
+current_deadline = contextvars.ContextVar("llm_deadline", default=None)
+
+# Failures worth another attempt: the provider was slow, unreachable,
+# rate limited or broken, not the request itself
+RETRYABLE = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+
+def set_deadline(seconds):
+    if seconds > 0:
+        current_deadline.set(time.monotonic() + seconds)
+
+
+def remaining():
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class UpstreamUnavailable(Exception):
+    retry_after = 1
+
+
+class CircuitOpen(UpstreamUnavailable):
+    def __init__(self, model, wait):
+        super().__init__(f"{model} is failing; not calling it for {wait:.0f}s")
+        self.retry_after = max(1, math.ceil(wait))
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    def __init__(self, model, reason="did not answer within the request deadline"):
+        super().__init__(f"{model} {reason}")
+
+
+class LocalDeadlineExceeded(DeadlineExceeded):
+    # The deadline ran out in our own queue, or left the attempt less time
+    # than the model usually needs: says nothing about the model
+    def __init__(self, model):
+        super().__init__(model, "got no fair chance to answer before the request deadline ran out")
+
+
+class CircuitBreaker:
+    # Opens when at least failure_ratio of the last window calls (and at least
+    # min_calls of them) failed. While open every call fails fast; after
+    # cooldown a single probe call is let through, which closes the breaker
+    # on success or opens it again on failure.
+    def __init__(self, window=20, min_calls=10, failure_ratio=0.5, cooldown=30.0):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        return HALF_OPEN if time.monotonic() - self.opened_at >= self.cooldown else OPEN
+
+    def check(self, model):
+        if self.opened_at is None:
+            return
+        wait = self.opened_at + self.cooldown - time.monotonic()
+        if wait > 0 or self.probing:
+            raise CircuitOpen(model, max(wait, 1))
+        self.probing = True
+
+    def record(self, ok):
+        if self.opened_at is not None:
+            self.probing = False
+            if ok:
+                self.opened_at = None
+                self.outcomes.clear()
+            else:
+                self.opened_at = time.monotonic()
+            return
+        self.outcomes.append(ok)
+        failures = self.outcomes.count(False)
+        if len(self.outcomes) >= self.min_calls and failures >= self.failure_ratio * len(self.outcomes):
+            self.opened_at = time.monotonic()
+
+    def abandon(self):
+        # A probe that ended without telling anything about the upstream
+        self.probing = False
+
+
+class RetryBudget:
+    # Retries (and hedges) may add at most ratio extra calls per call made,
+    # plus min_per_second, so a failing upstream is not hit with a multiple
+    # of the normal load
+    def __init__(self, ratio=0.2, min_per_second=1.0, capacity=20.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self.balance = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, amount=0.0):
+        now = time.monotonic()
+        self.balance = min(self.capacity, self.balance + (now - self._updated) * self.min_per_second + amount)
+        self._updated = now
+
+    def deposit(self):
+        self._refill(self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+class ModelHealth:
+    def __init__(self, breaker: CircuitBreaker, samples=200):
+        self.breaker = breaker
+        self.latencies = deque(maxlen=samples)  # seconds of successful calls
+        self.outcomes = deque(maxlen=samples)
+
+    def record(self, ok, latency=None):
+        self.outcomes.append(ok)
+        if latency is not None:
+            self.latencies.append(latency)
+        self.breaker.record(ok)
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+
+# Deadlines, jittered retries within a retry budget, optional hedging and a
+# circuit breaker per model around single upstream attempts. An attempt is a
+# coroutine function taking the seconds left until the deadline (or None).
+# With a slot (an object with an acquire() coroutine returning a token and
+# release(token), e.g. a scheduler slot) every attempt first waits for one;
+# that wait is local queueing and is neither timed nor held against the model.
+class Resilience:
+    def __init__(self, attempts=3, backoff_base=0.5, backoff_max=8.0, budget=None, hedge=False,
+                 hedge_quantile=0.95, hedge_min_samples=20, hedge_min_delay=0.5, breaker=None):
+        self.attempts = attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.budget = budget or RetryBudget()
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or {}
+        self._health = {}
+
+    def health(self, model) -> ModelHealth:
+        health = self._health.get(model)
+        if health is None:
+            health = self._health[model] = ModelHealth(CircuitBreaker(**self.breaker))
+        return health
+
+    async def call(self, model, attempt, hedge=True, timed=True, slot=None):
+        # hedge: allow a duplicate attempt when this one is slow; timed: its
+        # latency is a whole completion and counts towards the percentiles
+        health = self.health(model)
+        self.budget.deposit()
+        for number in itertools.count(1):
+            health.breaker.check(model)
+            try:
+                if hedge and self.hedge and health.breaker.state == CLOSED:
+                    return await self._hedged(model, health, attempt, timed, slot)
+                return await self._attempt(model, health, attempt, timed, slot)
+            except RETRYABLE as e:
+                if number >= self.attempts or not self.budget.withdraw():
+                    raise
+                # Full jitter, so retries of a burst do not arrive together
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (number - 1)))
+                left = remaining()
+                if left is not None and delay >= left:
+                    raise
+                metrics.llm_retries.inc(model, type(e).__name__)
+                await asyncio.sleep(delay)
+
+    async def _acquire(self, model, slot):
+        if slot is None:
+            return None
+        left = remaining()
+        if left is not None and left <= 0:
+            raise LocalDeadlineExceeded(model)
+        try:
+            return await asyncio.wait_for(slot.acquire(), left)
+        except asyncio.TimeoutError:
+            raise LocalDeadlineExceeded(model) from None
+
+    async def _attempt(self, model, health, attempt, timed, slot=None, started=None):
+        # started: set once the attempt holds its slot and goes upstream
+        try:
+            token = await self._acquire(model, slot)
+        except BaseException:
+            health.breaker.abandon()
+            raise
+        if started is not None:
+            started.set()
+        try:
+            left = remaining()
+            if left is not None and left <= 0:
+                health.breaker.abandon()
+                raise LocalDeadlineExceeded(model)
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(attempt(left), left)
+            except asyncio.TimeoutError:
+                usual = health.percentile(0.95)
+                if usual is not None and time.perf_counter() - start < usual:
+                    health.breaker.abandon()
+                    raise LocalDeadlineExceeded(model) from None
+                health.record(False)
+                raise DeadlineExceeded(model) from None
+            except RETRYABLE:
+                health.record(False)
+                raise
+            except BaseException:
+                # Cancelled or refused as a bad request: nothing learned
+                # about the upstream's health
+                health.breaker.abandon()
+                raise
+            health.record(True, time.perf_counter() - start if timed else None)
+            return result
+        finally:
+            if slot is not None:
+                slot.release(token)
+
+    async def _hedged(self, model, health, attempt, timed, slot):
+        # Sends a duplicate once the first attempt has been upstream for longer
+        # than the recent hedge_quantile latency; the first good answer wins
+        if len(health.latencies) < self.hedge_min_samples:
+            return await self._attempt(model, health, attempt, timed, slot)
+        delay = max(self.hedge_min_delay, health.percentile(self.hedge_quantile))
+        started = asyncio.Event()
+        first = asyncio.ensure_future(self._attempt(model, health, attempt, timed, slot, started))
+        tasks = [first]
+        waiting = asyncio.ensure_future(started.wait())
+        try:
+            # The delay counts from when the first attempt got its slot
+            await asyncio.wait([first, waiting], return_when=asyncio.FIRST_COMPLETED)
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self.budget.withdraw():
+                return await first
+            metrics.llm_hedges.inc(model, "sent")
+            tasks.append(asyncio.ensure_future(self._attempt(model, health, attempt, timed, slot)))
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            metrics.llm_hedges.inc(model, "won")
+                        return task.result()
+                if not pending:
+                    return await first
+        finally:
+            waiting.cancel()
+            for task in tasks:
+                task.cancel()
+
+    def states(self):
+        return [((model,), health.breaker.state) for model, health in self._health.items()]
+
+    def stats(self):
+        return {
+            "retryBudget": round(self.budget.balance, 2),
+            "models": {
+                model: {
+                    "circuit": ("closed", "half_open", "open")[health.breaker.state],
+                    "p50": health.percentile(0.5),
+                    "p95": health.percentile(0.95),
+                    "errorRate": round(health.error_rate(), 3),
+                    "samples": len(health.outcomes),
+                }
+                for model, health in self._health.items()
+            },
+        }
@@ -0,0 +1,86 @@
+# app/responses.py
+import logging
+from typing import Any, Dict
+
+import orjson
+from pydantic import BaseModel, ValidationError
+from starlette.responses import JSONResponse, Response
+
+from . import metrics
+from .graph import fix_graph
+from .jsonrepair import repair
+from .models import CascadeRanking, PatientExplanation, SimulationGraph
+
+logger = logging.getLogger(__name__)
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+class RawJSONResponse(Response):
+    # Body that is already canonical JSON (see dump), sent without re-encoding
+    media_type = "application/json"
+
+
+class MalformedModelOutput(ValueError):
+    pass
+
+
+def load_json(content, kind, roots="{["):
+    # Strict parse first; on failure one repair pass instead of a new upstream
+    # call. roots: what the value may start with, "{" for an object.
+    try:
+        data = orjson.loads(content)
+        metrics.llm_output_json.inc(kind, "clean")
+        return data
+    except orjson.JSONDecodeError as e:
+        error = e
+    repaired, fixes = repair(content, roots)
+    try:
+        if not fixes:
+            raise error
+        data = orjson.loads(repaired)
+    except orjson.JSONDecodeError:
+        metrics.llm_output_json.inc(kind, "failed")
+        raise MalformedModelOutput(f"Model output is not valid JSON ({kind}): {error}") from error
+    metrics.llm_output_json.inc(kind, "repaired")
+    logger.info("Repaired %d JSON defect(s) in %s output", fixes, kind)
+    return data
+
+
+def parse_model(content, model_class, kind):
+    data = load_json(content, kind, roots="{")
+    try:
+        return model_class.model_validate(data)
+    except ValidationError as e:
+        raise MalformedModelOutput(f"Model output is not a valid {model_class.__name__}: {e}") from e
+
+
+def parse_graph(content) -> SimulationGraph:
+    return fix_graph(parse_model(content, SimulationGraph, "graph"))
+
+
+def parse_ranking(content) -> CascadeRanking:
+    return parse_model(content, CascadeRanking, "ranking")
+
+
+def parse_explanation(content) -> PatientExplanation:
+    return parse_model(content, PatientExplanation, "explanation")
+
+
+def parse_levels(content, model_class, kind, levels) -> Dict[int, BaseModel]:
+    # {"1": <model_class>, "2": ..., "3": ...} from an all-levels call
+    data = load_json(content, kind, roots="{")
+    try:
+        return {level: model_class.model_validate(data[str(level)]) for level in levels}
+    except (KeyError, TypeError) as e:
+        raise MalformedModelOutput(f"Model output is missing explanation level {e}") from e
+    except ValidationError as e:
+        raise MalformedModelOutput(f"Model output is not a valid {model_class.__name__}: {e}") from e
+
+
+def dump(model: BaseModel) -> str:
+    # Canonical JSON of a parsed response, which is what the caches store
+    return orjson.dumps(model.model_dump(by_alias=True)).decode("utf-8")
@@ -0,0 +1,150 @@
+# app/router.py
+import random
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+
+SPEND_WINDOW = 3600.0
+
+
+class _Window:
+    # Recent latency and outcomes of one model on one route
+    def __init__(self, samples):
+        self.latencies = deque(maxlen=samples)
+        self.outcomes = deque(maxlen=samples)
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+
+# Picks the model for each completion call of a route ("result" for graphs
+# and rankings, "patient" for explanations) from the route's candidates, in
+# order of preference:
+#
+#   - candidates whose context cannot hold the prompt are skipped
+#   - so are unhealthy ones: breaker open, or (with enough samples) an error
+#     rate above max_error_rate or a p95 latency above the route's SLO. A
+#     probe_ratio share of calls still goes to an unhealthy candidate so its
+#     figures can recover.
+#   - once the spend of the last hour reaches the budget, the cheapest
+#     healthy candidate is used
+#   - explainTypes listed in fastest go to the healthy candidate with the
+#     lowest p50 on this route
+#
+# The first candidate is used when nothing else applies or nothing is healthy
+# (its breaker then fails the call fast).
+class Router:
+    def __init__(self, routes: Dict[str, List[str]], circuit_open: Callable[[str], bool],
+                 latency_slo: Dict[str, float], max_error_rate=0.2, min_samples=20,
+                 max_prompt_tokens: Optional[Dict[str, int]] = None,
+                 prices: Optional[Dict[str, Tuple[float, float]]] = None, budget_per_hour=0.0,
+                 fastest=(), probe_ratio=0.05, samples=100):
+        self.routes = routes
+        self.circuit_open = circuit_open
+        self.latency_slo = latency_slo
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.max_prompt_tokens = max_prompt_tokens or {}
+        self.prices = prices or {}
+        self.budget_per_hour = budget_per_hour
+        self.fastest = set(fastest)
+        self.probe_ratio = probe_ratio
+        self.samples = samples
+        self._windows: Dict[Tuple[str, str], _Window] = {}
+        self._spend = deque()  # (time, dollars)
+
+    def _window(self, route, model) -> _Window:
+        window = self._windows.get((route, model))
+        if window is None:
+            window = self._windows[route, model] = _Window(self.samples)
+        return window
+
+    def _problem(self, route, model) -> Optional[str]:
+        # Why model should not take route's calls right now, if it should not
+        if self.circuit_open(model):
+            return "circuit"
+        window = self._window(route, model)
+        if len(window.outcomes) < self.min_samples:
+            return None
+        if window.error_rate() > self.max_error_rate:
+            return "errors"
+        slo = self.latency_slo.get(route)
+        if slo and len(window.latencies) >= self.min_samples and window.percentile(0.95) > slo:
+            return "latency"
+        return None
+
+    def choose(self, route, prompt_tokens, explain_type=None) -> str:
+        candidates = self.routes[route]
+        fitting = [model for model in candidates if prompt_tokens <= self.max_prompt_tokens.get(model, prompt_tokens)]
+        model, reason = candidates[0], "primary"
+        if not fitting:
+            fitting = candidates[-1:]
+        if fitting[0] != candidates[0]:
+            model, reason = fitting[0], "prompt_size"
+
+        problems = {candidate: self._problem(route, candidate) for candidate in fitting}
+        healthy = [candidate for candidate in fitting if problems[candidate] is None]
+        if problems[model] is not None and healthy and random.random() >= self.probe_ratio:
+            model, reason = healthy[0], problems[model]
+
+        if healthy and self.budget_per_hour > 0 and self.spent() >= self.budget_per_hour:
+            cheapest = min(healthy, key=lambda candidate: sum(self.prices.get(candidate, (0.0, 0.0))))
+            if cheapest != model:
+                model, reason = cheapest, "budget"
+        elif healthy and explain_type in self.fastest:
+            timed = [(self._window(route, candidate).percentile(0.5), candidate) for candidate in healthy]
+            timed = [(p50, candidate) for p50, candidate in timed if p50 is not None]
+            if timed and min(timed)[1] != model:
+                model, reason = min(timed)[1], "fastest"
+
+        metrics.route_decisions.inc(route, model, reason)
+        return model
+
+    def observe(self, route, model, ok, latency=None):
+        window = self._window(route, model)
+        window.outcomes.append(ok)
+        if latency is not None:
+            window.latencies.append(latency)
+            metrics.route_latency.observe(route, model, value=latency)
+        if not ok:
+            metrics.route_errors.inc(route, model)
+
+    def charge(self, route, model, prompt_tokens, completion_tokens):
+        input_price, output_price = self.prices.get(model, (0.0, 0.0))
+        dollars = (prompt_tokens * input_price + completion_tokens * output_price) / 1e6
+        self._spend.append((time.monotonic(), dollars))
+        metrics.route_cost.inc(route, model, amount=dollars)
+
+    def spent(self):
+        # Dollars spent over the last hour
+        cutoff = time.monotonic() - SPEND_WINDOW
+        while self._spend and self._spend[0][0] < cutoff:
+            self._spend.popleft()
+        return sum(dollars for _, dollars in self._spend)
+
+    def stats(self):
+        return {
+            "spentLastHour": round(self.spent(), 4),
+            "budgetPerHour": self.budget_per_hour or None,
+            "routes": {
+                route: {
+                    model: {
+                        "p50": self._window(route, model).percentile(0.5),
+                        "p95": self._window(route, model).percentile(0.95),
+                        "errorRate": round(self._window(route, model).error_rate(), 3),
+                        "samples": len(self._window(route, model).outcomes),
+                        "problem": self._problem(route, model),
+                    }
+                    for model in models
+                }
+                for route, models in self.routes.items()
+            },
+        }
@@ -0,0 +1,380 @@
+# app/scheduler.py
+import asyncio
+import contextvars
+import itertools
+import math
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from . import metrics
+from .tenants import current_tenant
+
+# Lower runs first. The priority of a completion call is taken from the
+# context of the task making it, so e.g. every call under a batch item runs
+# at BATCH without threading a parameter through the call chain.
+INTERACTIVE, BATCH, PREFETCH = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch", PREFETCH: "prefetch"}
+current_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+class SharedPriority:
+    # The level of work done for several callers (app/singleflight.py):
+    # that of the most urgent one so far. Raising it moves the work's queued
+    # slot requests up with it, and the shared work it waits on in turn.
+    def __init__(self, level):
+        self.level = level
+        self.queues = set()
+        self.joined = set()
+
+    def raise_to(self, level):
+        if level < self.level:
+            self.level = level
+            for queue in self.queues:
+                queue.wake()
+            for shared in self.joined:
+                shared.raise_to(level)
+
+
+current_shared = contextvars.ContextVar("llm_shared_priority", default=None)
+
+
+def priority():
+    # The level calls made from the current context run at
+    shared = current_shared.get()
+    level = current_priority.get()
+    return level if shared is None else min(level, shared.level)
+
+# Seconds of granted calls the fairness index looks back over
+FAIRNESS_WINDOW = 60.0
+# Recent calls whose slot hold times the admission estimate is taken from
+HOLD_SAMPLES = 100
+
+
+class Overloaded(Exception):
+    def __init__(self, model, wait):
+        super().__init__(f"{model} is overloaded for about {wait:.0f}s")
+        self.retry_after = max(1, math.ceil(wait))
+
+
+class TokenBucket:
+    # Refills continuously at per_minute / 60 per second up to per_minute;
+    # per_minute <= 0 means unlimited. The level may go negative when a call
+    # turns out to cost more than estimated, which delays later calls.
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait(self, amount) -> float:
+        # Seconds until amount (capped at the capacity) is available
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount):
+        if self.capacity > 0:
+            self._refill()
+            self.level -= amount
+
+
+class _Waiter:
+    __slots__ = ("base", "shared", "finish", "seq", "cost", "tenant", "future")
+
+    def __init__(self, base, shared, finish, seq, cost, tenant, future):
+        self.base = base
+        self.shared = shared
+        self.finish = finish
+        self.seq = seq
+        self.cost = cost
+        self.tenant = tenant
+        self.future = future
+
+    @property
+    def level(self):
+        return self.base if self.shared is None else min(self.base, self.shared.level)
+
+    def order(self):
+        return self.level, self.finish, self.seq
+
+
+class _ModelQueue:
+    # Waiting calls are ordered by priority, then by a self-clocked fair
+    # queuing tag: a tenant's next call finishes cost / weight after the later
+    # of its previous call and the tag of the call granted last, so tenants
+    # with work queued get tokens in proportion to their weights however many
+    # calls each of them sends.
+    def __init__(self, model, rpm, tpm):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.waiting = []
+        self.vtime = 0.0
+        self.finish = {}  # tenant -> tag of its last call
+        self._pump = None
+        self._wakeup = None
+
+    def wait(self, cost) -> float:
+        return max(self.requests.wait(1), self.tokens.wait(cost))
+
+    def wait_behind(self, cost, level) -> float:
+        # Estimated queueing time for a new call: everything queued at the
+        # same or a higher priority goes first
+        ahead = [waiter for waiter in self.waiting if waiter.level <= level and not waiter.future.done()]
+        return max(self.requests.wait(len(ahead) + 1), self.tokens.wait(sum(w.cost for w in ahead) + cost))
+
+    def tag(self, tenant, cost, weight):
+        finish = max(self.vtime, self.finish.get(tenant, 0.0)) + cost / weight
+        self.finish[tenant] = finish
+        return finish
+
+    def take(self, cost):
+        self.requests.take(1)
+        self.tokens.take(cost)
+
+    def forget(self, tenant):
+        # An idle tenant starts again from the virtual time, like a new one
+        if not any(waiter.tenant == tenant and not waiter.future.done() for waiter in self.waiting):
+            self.finish.pop(tenant, None)
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def enqueue(self, scheduler, waiter):
+        self.waiting.append(waiter)
+        if self._pump is None:
+            self._wakeup = asyncio.Event()
+            self._pump = asyncio.ensure_future(self._run(scheduler))
+        else:
+            self.wake()
+
+    async def _run(self, scheduler):
+        # Grants queued calls as the buckets refill and in-flight calls end.
+        # Every arrival and release wakes it, so the pick is always made
+        # against the current queue.
+        try:
+            while True:
+                self.waiting = [waiter for waiter in self.waiting if not waiter.future.done()]
+                if not self.waiting:
+                    break
+                self._wakeup.clear()
+                startable = [waiter for waiter in self.waiting if scheduler.can_start(waiter.tenant)]
+                timeout = None
+                if startable:
+                    waiter = min(startable, key=_Waiter.order)
+                    timeout = self.wait(waiter.cost)
+                    if timeout == 0:
+                        self.waiting.remove(waiter)
+                        self.vtime = waiter.finish
+                        self.take(waiter.cost)
+                        scheduler.start(waiter.tenant, waiter.cost)
+                        waiter.future.set_result(None)
+                        continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._pump = None
+
+
+# Admission control, rate limiting and tenant fairness in front of every
+# completion call. Each model has a requests-per-minute and a
+# tokens-per-minute bucket; a call costs one request and its estimated
+# tokens. On top of that at most max_in_flight calls are open upstream, and
+# at most the tenant's cap for any one tenant. Calls that fit go straight
+# through, the rest queue. A call whose estimated queueing time exceeds the
+# latency SLO of its priority is refused with Overloaded instead of joining
+# a queue it would time out in. The estimate covers both the buckets and the
+# calls that have to end before a concurrency slot frees up, at the median
+# time a call holds its slot.
+class Scheduler:
+    def __init__(self, limits: Dict[str, Tuple[int, int]], slo: Dict[int, float], max_in_flight=0,
+                 weights: Optional[Dict[str, float]] = None, caps: Optional[Dict[str, int]] = None, default_cap=0):
+        self.limits = limits
+        self.slo = slo
+        self.max_in_flight = max_in_flight
+        self.weights = weights or {}
+        self.caps = caps or {}
+        self.default_cap = default_cap
+        self.in_flight = 0
+        self.tenant_in_flight: Dict[str, int] = {}
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._seq = itertools.count()
+        self._granted = deque()  # (time, tenant, cost) within FAIRNESS_WINDOW
+        self._holds = deque(maxlen=HOLD_SAMPLES)  # seconds recent calls held their slot
+
+    def _queue(self, model) -> _ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            rpm, tpm = self.limits.get(model, (0, 0))
+            queue = self._queues[model] = _ModelQueue(model, rpm, tpm)
+        return queue
+
+    def weight(self, tenant):
+        return self.weights.get(tenant, 1.0)
+
+    def can_start(self, tenant):
+        if 0 < self.max_in_flight <= self.in_flight:
+            return False
+        cap = self.caps.get(tenant, self.default_cap)
+        return cap <= 0 or self.tenant_in_flight.get(tenant, 0) < cap
+
+    def start(self, tenant, cost):
+        self.in_flight += 1
+        self.tenant_in_flight[tenant] = self.tenant_in_flight.get(tenant, 0) + 1
+        self._granted.append((time.monotonic(), tenant, cost))
+        metrics.tenant_tokens.inc(tenant, amount=cost)
+
+    def release(self, tenant, held=None):
+        # held: seconds the call held its slot
+        if held is not None:
+            self._holds.append(held)
+        self.in_flight -= 1
+        self.tenant_in_flight[tenant] -= 1
+        if not self.tenant_in_flight[tenant]:
+            del self.tenant_in_flight[tenant]
+            self._forget(tenant)
+        for queue in self._queues.values():
+            queue.wake()
+
+    def _forget(self, tenant):
+        # Drops the fair queuing tags of a tenant with nothing queued or in
+        # flight, so the tag tables do not grow with every tenant ever seen
+        if tenant not in self.tenant_in_flight:
+            for queue in self._queues.values():
+                queue.forget(tenant)
+
+    def hold_time(self) -> Optional[float]:
+        if not self._holds:
+            return None
+        return sorted(self._holds)[len(self._holds) // 2]
+
+    def slot_wait(self, tenant, level) -> float:
+        # Estimated wait for a concurrency slot: the calls that have to end
+        # before this one can start, at max_in_flight (or the tenant's cap)
+        # of them per median hold time. Nothing is known before the first
+        # call ends.
+        hold = self.hold_time()
+        if hold is None:
+            return 0.0
+        ahead = [
+            waiter for queue in self._queues.values() for waiter in queue.waiting
+            if waiter.level <= level and not waiter.future.done()
+        ]
+        wait = 0.0
+        if self.max_in_flight > 0:
+            behind = self.in_flight + len(ahead) + 1 - self.max_in_flight
+            wait = max(wait, behind / self.max_in_flight * hold)
+        cap = self.caps.get(tenant, self.default_cap)
+        if cap > 0:
+            behind = self.tenant_in_flight.get(tenant, 0) + sum(w.tenant == tenant for w in ahead) + 1 - cap
+            wait = max(wait, behind / cap * hold)
+        return wait
+
+    def check(self, model, cost):
+        # Admission test without taking capacity, for endpoints that must
+        # answer 503 before they start streaming
+        level = priority()
+        wait = max(self._queue(model).wait_behind(cost, level), self.slot_wait(current_tenant.get(), level))
+        if wait > self.slo[level]:
+            metrics.scheduler_shed.inc(model, PRIORITY_NAMES[level])
+            raise Overloaded(model, wait)
+
+    async def acquire(self, model, cost) -> str:
+        # Returns the tenant to release() once the call is over
+        shared = current_shared.get()
+        tenant = current_tenant.get()
+        queue = self._queue(model)
+        self.check(model, cost)
+        start = time.perf_counter()
+        finish = queue.tag(tenant, cost, self.weight(tenant))
+        if not queue.waiting and queue.wait(cost) == 0 and self.can_start(tenant):
+            queue.vtime = finish
+            queue.take(cost)
+            self.start(tenant, cost)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            if shared is not None:
+                shared.queues.add(queue)
+            queue.enqueue(self, _Waiter(current_priority.get(), shared, finish, next(self._seq), cost, tenant, future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted just as the caller gave up
+                    self.release(tenant)
+                else:
+                    future.cancel()
+                    self._forget(tenant)
+                raise
+        waited = time.perf_counter() - start
+        metrics.scheduler_wait.observe(model, PRIORITY_NAMES[priority()], value=waited)
+        metrics.tenant_wait.observe(tenant, value=waited)
+        return tenant
+
+    def settle(self, model, estimate, actual):
+        # Charge the difference once the provider has reported real usage
+        self._queue(model).tokens.take(actual - estimate)
+
+    def queued(self):
+        # ((model, priority), calls waiting) for the queue depth gauge
+        counts = {(model, name): 0 for model in self._queues for name in PRIORITY_NAMES.values()}
+        for model, queue in self._queues.items():
+            for waiter in queue.waiting:
+                if not waiter.future.done():
+                    counts[model, PRIORITY_NAMES[waiter.level]] += 1
+        return list(counts.items())
+
+    def shares(self) -> Dict[str, float]:
+        # Tokens granted per tenant over the last FAIRNESS_WINDOW, divided by
+        # the tenant's weight
+        cutoff = time.monotonic() - FAIRNESS_WINDOW
+        while self._granted and self._granted[0][0] < cutoff:
+            self._granted.popleft()
+        shares = {}
+        for _, tenant, cost in self._granted:
+            shares[tenant] = shares.get(tenant, 0.0) + cost / self.weight(tenant)
+        return shares
+
+    def fairness(self) -> float:
+        # Jain's index of the weighted shares of the tenants served recently
+        # or waiting now: 1.0 when all of them got the same weighted share,
+        # 1 / tenants when one got it all
+        shares = self.shares()
+        for queue in self._queues.values():
+            for waiter in queue.waiting:
+                if not waiter.future.done():
+                    shares.setdefault(waiter.tenant, 0.0)
+        shares = list(shares.values())
+        if not shares or not any(shares):
+            return 1.0
+        return sum(shares) ** 2 / (len(shares) * sum(share * share for share in shares))
+
+    def stats(self):
+        return {
+            "models": {
+                model: {
+                    "requestsAvailable": round(queue.requests.level) if queue.requests.capacity > 0 else None,
+                    "tokensAvailable": round(queue.tokens.level) if queue.tokens.capacity > 0 else None,
+                    "queued": sum(1 for waiter in queue.waiting if not waiter.future.done()),
+                }
+                for model, queue in self._queues.items()
+            },
+            "inFlight": self.in_flight,
+            "holdP50": self.hold_time(),
+            "tenants": {
+                tenant: {"inFlight": self.tenant_in_flight.get(tenant, 0), "weightedShare": round(share)}
+                for tenant, share in self.shares().items()
+            },
+            "fairness": round(self.fairness(), 3),
+        }
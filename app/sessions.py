@@ -0,0 +1,72 @@
+# app/sessions.py
+import secrets
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import orjson
+from pydantic import BaseModel
+
+from .explain import SECTIONS
+from .models import PatientInfo, PatientScenario, Prescription, Reaction, SimulateResult
+
+
+class Session:
+    # A patient and the prescriptions / reactions of the graph produced for
+    # them, kept as model instances: pydantic does not revalidate instances,
+    # so a request assembled from them only validates its top-level fields.
+    def __init__(self, patient_info: PatientInfo, graph: str):
+        self.patient = patient_info.model_dump()
+        self.items: Dict[str, BaseModel] = {}
+        for node in orjson.loads(graph)["nodes"]:
+            model_class = Prescription if "drugId" in node else Reaction
+            self.items[node["id"]] = model_class(**{field: node[field] for field in model_class.model_fields})
+
+    def simulate_request(self, node_ids: List[str], explain_type) -> SimulateResult:
+        # The SimulateResult the client would have sent for these nodes;
+        # KeyError for an id that is not in the graph
+        sections = {section: [] for section in SECTIONS}
+        for node_id in node_ids:
+            sections[node_id.rsplit("-", 1)[0]].append(self.items[node_id])
+        return SimulateResult(**self.patient, explainType=explain_type, scenario=PatientScenario(**sections))
+
+
+# In-memory LRU of sessions by graph id. Every lookup extends a session's
+# TTL, so the least recently used entry is also the first to expire and both
+# limits are enforced by evicting from the front.
+class SessionStore:
+    def __init__(self, max_entries=10000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # graph id -> (expires_at, session)
+        self.evictions = 0
+
+    def create(self, patient_info: PatientInfo, graph: str) -> str:
+        graph_id = secrets.token_urlsafe(16)
+        self._sessions[graph_id] = (time.monotonic() + self.ttl, Session(patient_info, graph))
+        self._evict()
+        return graph_id
+
+    def get(self, graph_id) -> Optional[Session]:
+        entry = self._sessions.get(graph_id)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry[0] <= now:
+            del self._sessions[graph_id]
+            return None
+        self._sessions[graph_id] = (now + self.ttl, entry[1])
+        self._sessions.move_to_end(graph_id)
+        return entry[1]
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._sessions:
+            graph_id, (expires_at, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_entries and expires_at > now:
+                break
+            del self._sessions[graph_id]
+            self.evictions += 1
+
+    def stats(self):
+        return {"entries": len(self._sessions), "evictions": self.evictions}
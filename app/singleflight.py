@@ -0,0 +1,75 @@
+# app/singleflight.py
+import asyncio
+
+from .scheduler import SharedPriority, current_shared
+
+
+class _Flight:
+    __slots__ = ("task", "priority", "waiters")
+
+    def __init__(self, level):
+        self.task = None
+        self.priority = SharedPriority(level)
+        self.waiters = 0
+
+
+# Coalesces concurrent calls that share a key: the first caller starts the
+# work, everyone arriving while it is still running awaits the same task.
+# The work runs in the context of the caller that started it, except for its
+# scheduler priority: a more urgent caller joining raises it, so calls of the
+# work still queued for a slot move up and those already upstream are simply
+# shared. A joining caller waits at most its own timeout. One caller going
+# away does not cancel the work; the last one does, and waits until it has
+# stopped.
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    async def do(self, key, fn, level=0, timeout=None):
+        # timeout: how long to wait on work someone else started; work this
+        # call starts runs under its own deadlines
+        flight = self._inflight.get(key)
+        if flight is None:
+            timeout = None
+            self.calls += 1
+            flight = _Flight(level)
+            flight.task = asyncio.ensure_future(self._run(flight.priority, fn))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.collapsed += 1
+            flight.priority.raise_to(level)
+        caller = current_shared.get()
+        if caller is not None:
+            # Called from shared work, which this now waits on
+            caller.joined.add(flight.priority)
+        flight.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight.task), timeout)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+                await asyncio.wait([flight.task])
+
+    @staticmethod
+    async def _run(priority, fn):
+        current_shared.set(priority)
+        return await fn()
+
+    def _done(self, key, task):
+        flight = self._inflight.get(key)
+        if flight is not None and flight.task is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter went away
+            task.exception()
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "collapsed": self.collapsed,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,49 @@
+# app/tenants.py
+import contextvars
+import re
+
+DEFAULT_TENANT = "default"
+current_tenant = contextvars.ContextVar("tenant", default=DEFAULT_TENANT)
+
+_TENANT_NAME = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+def _api_key(headers):
+    key = headers.get(b"x-api-key")
+    if key is None:
+        authorization = headers.get(b"authorization", b"")
+        if authorization[:7].lower() == b"bearer ":
+            key = authorization[7:]
+    return key.decode("latin-1").strip() if key else None
+
+
+# Pure ASGI middleware that decides which tenant a request belongs to and
+# stores it in current_tenant, where the scheduler reads it for every
+# completion call the request makes (including calls made by tasks it spawns
+# and by streamed bodies). With TENANT_API_KEYS configured the tenant is the
+# one of the API key (X-API-Key or a bearer token); without, the X-Tenant-ID
+# header is taken if it names a configured tenant (known). Everything else
+# shares the default tenant, so clients cannot mint tenants (and metric
+# labels, or extra concurrency and weight) by sending new ids.
+class TenantMiddleware:
+    def __init__(self, app, api_keys, known=()):
+        self.app = app
+        self.api_keys = api_keys
+        self.known = set(known)
+
+    def tenant(self, scope):
+        headers = dict(scope["headers"])
+        if self.api_keys:
+            return self.api_keys.get(_api_key(headers), DEFAULT_TENANT)
+        claimed = headers.get(b"x-tenant-id", b"").decode("latin-1").strip()
+        return claimed if claimed in self.known and _TENANT_NAME.match(claimed) else DEFAULT_TENANT
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = current_tenant.set(self.tenant(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_tenant.reset(token)
@@ -0,0 +1,368 @@
+# bench/fake_openai.py
+# Local OpenAI-compatible stand-in for load tests. Serves
+# /v1/chat/completions (plain and streamed) with canned graph, ranking and
+# explanation payloads, a configurable time-to-first-token distribution, a token
+# generation rate and a simulated prompt-prefix cache. Faults (5xx errors,
+# 429s and stalled responses) can be injected at given rates, at startup or
+# at runtime through POST /faults. It also implements
+# enough of /v1/files and /v1/batches to run the offline Batch API pipeline
+# (python -m app.offline) end to end.
+#
+#   python -m bench.fake_openai --port 9100 --ttft lognormal:0.8,0.4 --tokens-per-sec 80
+#   python -m bench.fake_openai --error-rate 0.2 --stall-rate 0.05 --stall 30
+#   OPENAI_BASE_URL=http://127.0.0.1:9100/v1 OPENAI_API_KEY=fake uvicorn app.main:app
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+PAYLOAD_DIR = Path(__file__).parent / "payloads"
+
+# Rough chars-per-token for the mostly Korean prompts and payloads
+CHARS_PER_TOKEN = 2.0
+CACHE_BLOCK_TOKENS = 128
+CACHE_MIN_TOKENS = 1024
+# POST /faults fields -> FakeUpstream attributes
+FAULTS = {"errorRate": "error_rate", "rateLimitRate": "rate_limit_rate", "stallRate": "stall_rate", "stall": "stall"}
+
+
+def parse_distribution(spec):
+    # fixed:S | uniform:A,B | normal:MU,SIGMA | lognormal:MEDIAN,SIGMA | exp:MEAN
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",")] if args else []
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def estimate_tokens(text):
+    return max(1, int(len(text) / CHARS_PER_TOKEN))
+
+
+class FakeUpstream:
+    def __init__(self, ttft="fixed:0.5", tokens_per_sec=80.0, chunk_tokens=4, time_scale=1.0,
+                 graph_payload=None, explanation_payload=None, ranking_payload=None,
+                 error_rate=0.0, rate_limit_rate=0.0, stall_rate=0.0, stall=30.0):
+        self.ttft = parse_distribution(ttft)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.tokens_per_sec = tokens_per_sec
+        self.chunk_tokens = chunk_tokens
+        self.time_scale = time_scale
+        self.graph = self._load(graph_payload or PAYLOAD_DIR / "graph.json")
+        self.explanation = self._load(explanation_payload or PAYLOAD_DIR / "explanation.json")
+        self.ranking = self._load(ranking_payload or PAYLOAD_DIR / "ranking.json")
+        sections = json.loads(self.explanation)
+        self.fragments = {
+            kind: json.dumps(value, ensure_ascii=False, indent=2) for kind, value in (
+                ("prescription", {"items": sections["prescription1"]}),
+                ("reaction", {"items": sections["reaction1"]}),
+                ("total", {"totalResult": sections["totalResult"]}),
+            )
+        }
+        self._prefixes = set()
+        self.requests = 0
+
+    @staticmethod
+    def _load(path):
+        return json.dumps(json.loads(Path(path).read_text(encoding="utf-8")), ensure_ascii=False, indent=2)
+
+    def content_for(self, body):
+        prompt = body["messages"][-1].get("content") or ""
+        if "설명 유형 번호별로" in prompt:
+            # All explainType levels at once: the same answer for each
+            content = json.loads(self.content_for({**body, "messages": [{"content": prompt.split("설명 유형마다")[0]}]}))
+            return json.dumps({level: content for level in ("1", "2", "3")}, ensure_ascii=False, indent=2)
+        if "설명유형" in prompt[:400]:
+            # Explanations, whichever model the router sent them to. Per-item
+            # and totalResult prompts of the split explanation first
+            if "설명 대상 (약물)" in prompt:
+                return self.fragments["prescription"]
+            if "설명 대상 (부작용)" in prompt:
+                return self.fragments["reaction"]
+            if '"drugName"' not in prompt:
+                return self.fragments["total"]
+            return self.explanation
+        # The knowledge base prompt asks for a ranking of listed candidates
+        return self.ranking if '"ranking"' in prompt else self.graph
+
+    def usage(self, body, content):
+        prompt = "".join(message.get("content") or "" for message in body["messages"])
+        prompt_tokens = estimate_tokens(prompt)
+        # Emulate automatic prefix caching: the longest previously seen prompt
+        # prefix, in 128-token blocks and at least CACHE_MIN_TOKENS long, is
+        # reported as cached.
+        cached = 0
+        block_chars = int(CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN)
+        digest = hashlib.sha256()
+        for end in range(block_chars, len(prompt) + 1, block_chars):
+            digest.update(prompt[end - block_chars:end].encode("utf-8"))
+            key = digest.copy().hexdigest()
+            tokens = end // block_chars * CACHE_BLOCK_TOKENS
+            if key in self._prefixes and tokens >= CACHE_MIN_TOKENS:
+                cached = tokens
+            self._prefixes.add(key)
+        completion_tokens = estimate_tokens(content)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds * self.time_scale)
+
+    def fault(self):
+        # HTTP status to fail this request with, if any
+        draw = random.random()
+        if draw < self.error_rate:
+            return 500
+        if draw < self.error_rate + self.rate_limit_rate:
+            return 429
+        return None
+
+    def first_token_delay(self):
+        stalled = random.random() < self.stall_rate
+        return self.ttft() + (self.stall if stalled else 0.0)
+
+    def set_faults(self, faults):
+        for name, attribute in FAULTS.items():
+            if name in faults:
+                setattr(self, attribute, float(faults[name]))
+        return {name: getattr(self, attribute) for name, attribute in FAULTS.items()}
+
+    async def complete(self, body):
+        content = self.content_for(body)
+        usage = self.usage(body, content)
+        await self.sleep(self.first_token_delay() + usage["completion_tokens"] / self.tokens_per_sec)
+        return self.completion(body, content, usage)
+
+    def completion(self, body, content, usage):
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    async def stream(self, body):
+        content = self.content_for(body)
+        usage = self.usage(body, content)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        step = max(1, int(self.chunk_tokens * CHARS_PER_TOKEN))
+
+        def chunk(delta, finish_reason=None, usage=None):
+            choices = [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": choices,
+                "usage": usage,
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        await self.sleep(self.first_token_delay())
+        yield chunk({"role": "assistant", "content": ""})
+        for i in range(0, len(content), step):
+            yield chunk({"content": content[i:i + step]})
+            await self.sleep(self.chunk_tokens / self.tokens_per_sec)
+        yield chunk({}, finish_reason="stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield chunk(None, usage=usage)
+        yield "data: [DONE]\n\n"
+
+
+class FakeBatches:
+    # In-memory Files and Batches API. A batch is processed in the
+    # background right after creation, after batch_delay seconds.
+
+    def __init__(self, upstream, batch_delay=1.0):
+        self.upstream = upstream
+        self.batch_delay = batch_delay
+        self.files = {}
+        self.batches = {}
+
+    def add_file(self, content, filename, purpose):
+        file_id = f"file-{uuid.uuid4().hex}"
+        self.files[file_id] = {
+            "content": content,
+            "object": {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(content),
+                "created_at": int(time.time()),
+                "filename": filename,
+                "purpose": purpose,
+                "status": "processed",
+            },
+        }
+        return self.files[file_id]["object"]
+
+    def create(self, body):
+        if body.get("input_file_id") not in self.files:
+            raise HTTPException(status_code=404, detail="input file not found")
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body.get("endpoint"),
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "errors": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": body.get("metadata"),
+        }
+        self.batches[batch_id] = batch
+        asyncio.ensure_future(self._process(batch))
+        return batch
+
+    async def _process(self, batch):
+        lines = self.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+        requests = [json.loads(line) for line in lines if line.strip()]
+        batch["status"] = "in_progress"
+        batch["request_counts"]["total"] = len(requests)
+        await asyncio.sleep(self.batch_delay)
+
+        output = []
+        for request in requests:
+            body = request["body"]
+            content = self.upstream.content_for(body)
+            completion = self.upstream.completion(body, content, self.upstream.usage(body, content))
+            output.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": completion},
+                "error": None,
+            }, ensure_ascii=False))
+            batch["request_counts"]["completed"] += 1
+
+        output_file = self.add_file(("\n".join(output) + "\n").encode("utf-8"), "output.jsonl", "batch_output")
+        batch["output_file_id"] = output_file["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+
+def create_app(upstream: FakeUpstream, batches: FakeBatches = None):
+    app = FastAPI()
+    batches = batches or FakeBatches(upstream)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        upstream.requests += 1
+        status = upstream.fault()
+        if status is not None:
+            error = {"message": "Injected fault", "type": "server_error" if status >= 500 else "rate_limit_error"}
+            return JSONResponse({"error": error}, status_code=status, headers={"retry-after": "1"})
+        if body.get("stream"):
+            return StreamingResponse(upstream.stream(body), media_type="text/event-stream")
+        return await upstream.complete(body)
+
+    @app.post("/v1/files")
+    async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+        return batches.add_file(await file.read(), file.filename, purpose)
+
+    @app.get("/v1/files/{file_id}")
+    async def retrieve_file(file_id: str):
+        if file_id not in batches.files:
+            raise HTTPException(status_code=404, detail="file not found")
+        return batches.files[file_id]["object"]
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        if file_id not in batches.files:
+            raise HTTPException(status_code=404, detail="file not found")
+        return Response(batches.files[file_id]["content"], media_type="application/octet-stream")
+
+    @app.post("/v1/batches")
+    async def create_batch(request: Request):
+        return batches.create(await request.json())
+
+    @app.get("/v1/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str):
+        if batch_id not in batches.batches:
+            raise HTTPException(status_code=404, detail="batch not found")
+        return batches.batches[batch_id]
+
+    @app.post("/faults")
+    async def faults(request: Request):
+        # e.g. {"errorRate": 1.0} to take the upstream down, {"errorRate": 0} to bring it back
+        return upstream.set_faults(await request.json())
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "requests": upstream.requests}
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft", default="lognormal:0.8,0.4",
+                        help="time-to-first-token distribution, e.g. fixed:0.5, uniform:0.2,1, lognormal:0.8,0.4")
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0)
+    parser.add_argument("--chunk-tokens", type=int, default=4)
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="multiply every simulated delay, e.g. 0.1 for a quick run")
+    parser.add_argument("--graph-payload", help="JSON file returned for gpt-4o calls")
+    parser.add_argument("--explanation-payload", help="JSON file returned for other models")
+    parser.add_argument("--batch-delay", type=float, default=1.0,
+                        help="seconds before a submitted batch completes")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of completions answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of completions answered with 429")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="share of completions delayed by --stall")
+    parser.add_argument("--stall", type=float, default=30.0, help="extra seconds before a stalled first token")
+    args = parser.parse_args(argv)
+
+    upstream = FakeUpstream(
+        ttft=args.ttft,
+        tokens_per_sec=args.tokens_per_sec,
+        chunk_tokens=args.chunk_tokens,
+        time_scale=args.time_scale,
+        graph_payload=args.graph_payload,
+        explanation_payload=args.explanation_payload,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        stall_rate=args.stall_rate,
+        stall=args.stall,
+    )
+    app = create_app(upstream, FakeBatches(upstream, batch_delay=args.batch_delay))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# bench/loadtest.py
+# Drives the simulation endpoints at a fixed concurrency and reports
+# throughput, latency percentiles and event-loop lag. Event-loop lag is
+# measured as the latency of a /health probe fired every --probe-interval
+# while the load runs: /health does no work, so anything above a few
+# milliseconds is time the server's loop spent blocked.
+#
+#   python -m bench.loadtest --spawn --endpoint result --endpoint patient -c 16 -n 64
+#   python -m bench.loadtest --url http://localhost:8000 --endpoint result -c 8 -n 32
+import argparse
+import asyncio
+import copy
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+
+PAYLOAD_DIR = Path(__file__).parent / "payloads"
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+ENDPOINTS = {
+    "result": ("/simulation/result/", "patient_info.json", False),
+    "result-stream": ("/simulation/result/stream", "patient_info.json", True),
+    "patient": ("/simulation/patient/", "simulate_patient.json", False),
+    "patient-stream": ("/simulation/patient/stream", "simulate_patient.json", True),
+}
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies):
+    return {
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies) if latencies else float("nan"),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+@contextmanager
+def spawned_stack(args, upstream_args=(), upstream_port=None):
+    # Starts the fake upstream and the app as child processes on free ports
+    upstream_port, app_port = upstream_port or free_port(), free_port()
+    upstream_cmd = [
+        sys.executable, "-m", "bench.fake_openai", "--port", str(upstream_port),
+        "--ttft", args.ttft, "--tokens-per-sec", str(args.tokens_per_sec),
+        "--time-scale", str(args.time_scale), *upstream_args,
+    ]
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{upstream_port}/v1",
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "fake",
+        "LOG_LEVEL": "WARNING",
+    })
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    app_cmd = [
+        sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port),
+        "--log-level", "warning", "--no-access-log",
+    ]
+    processes = [subprocess.Popen(upstream_cmd, cwd=REPO_ROOT)]
+    try:
+        wait_until_up(f"http://127.0.0.1:{upstream_port}/health")
+        processes.append(subprocess.Popen(app_cmd, cwd=REPO_ROOT, env=env))
+        app_url = f"http://127.0.0.1:{app_port}"
+        wait_until_up(f"{app_url}/health")
+        yield app_url
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                # Graceful shutdown waits for open requests, e.g. stalled ones
+                process.kill()
+                process.wait()
+
+
+def make_payload(template, tag, index, unique):
+    payload = copy.deepcopy(template)
+    if unique:
+        # Distinct inputs so the result cache and request coalescing do not
+        # hide upstream cost
+        payload["name"] = f"{payload['name']}-{tag}-{index}"
+    return payload
+
+
+async def send(client, path, payload, streamed):
+    if not streamed:
+        response = await client.post(path, json=payload)
+        response.raise_for_status()
+        return
+    async with client.stream("POST", path, json=payload) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_bytes():
+            pass
+
+
+async def probe_loop_lag(client, interval, lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            await client.get("/health")
+            lags.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_endpoint(base_url, name, args):
+    path, payload_file, streamed = ENDPOINTS[name]
+    template = json.loads((PAYLOAD_DIR / payload_file).read_text(encoding="utf-8"))
+    latencies, errors = [], []
+    queue = asyncio.Queue()
+    for index in range(args.requests):
+        queue.put_nowait(index)
+
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client, \
+            httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as probe_client:
+
+        async def worker():
+            while True:
+                try:
+                    index = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                try:
+                    await send(client, path, make_payload(template, name, index, not args.repeat), streamed)
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    errors.append(repr(e))
+
+        lags, stop = [], asyncio.Event()
+        prober = asyncio.ensure_future(probe_loop_lag(probe_client, args.probe_interval, lags, stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await prober
+
+    return {
+        "endpoint": name,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "firstError": errors[0] if errors else None,
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "latency": summarize(latencies),
+        "loopLag": summarize(lags),
+    }
+
+
+def print_report(report):
+    latency, lag = report["latency"], report["loopLag"]
+    print(f"{report['endpoint']}: {report['ok']}/{report['requests']} ok, {report['errors']} errors, "
+          f"concurrency {report['concurrency']}, {report['elapsed']:.2f}s, {report['throughput']:.2f} req/s")
+    print(f"  latency  p50 {latency['p50'] * 1000:8.1f} ms  p95 {latency['p95'] * 1000:8.1f} ms  "
+          f"p99 {latency['p99'] * 1000:8.1f} ms  max {latency['max'] * 1000:8.1f} ms")
+    print(f"  loop lag p50 {lag['p50'] * 1000:8.1f} ms  p95 {lag['p95'] * 1000:8.1f} ms  "
+          f"p99 {lag['p99'] * 1000:8.1f} ms  max {lag['max'] * 1000:8.1f} ms")
+    if report["firstError"]:
+        print(f"  first error: {report['firstError']}")
+
+
+async def run(base_url, args):
+    reports = []
+    for name in args.endpoint or ["result"]:
+        reports.append(await run_endpoint(base_url, name, args))
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load benchmark for the simulation endpoints")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="base URL of an already running app")
+    target.add_argument("--spawn", action="store_true",
+                        help="start bench.fake_openai and app.main as child processes")
+    parser.add_argument("--endpoint", action="append", choices=sorted(ENDPOINTS))
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("-n", "--requests", type=int, default=32)
+    parser.add_argument("--repeat", action="store_true",
+                        help="send the identical payload every time (exercises caching/coalescing)")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--probe-interval", type=float, default=0.1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    spawn = parser.add_argument_group("--spawn options")
+    spawn.add_argument("--ttft", default="lognormal:0.8,0.4")
+    spawn.add_argument("--tokens-per-sec", type=float, default=80.0)
+    spawn.add_argument("--time-scale", type=float, default=1.0)
+    spawn.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                       help="extra environment for the spawned app")
+    args = parser.parse_args(argv)
+
+    if args.spawn:
+        with spawned_stack(args) as base_url:
+            reports = asyncio.run(run(base_url, args))
+    else:
+        reports = asyncio.run(run(args.url, args))
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        for report in reports:
+            print_report(report)
+
+
+if __name__ == "__main__":
+    main()
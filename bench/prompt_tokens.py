@@ -0,0 +1,123 @@
+# bench/prompt_tokens.py
+# Offline token counts of the /simulation/patient/ prompts before and after
+# the compact scenario encoding (app/encoding.py), for the sample request
+# scaled to a number of items per scenario section:
+#
+#   old: the patient fields one per line and each scenario section as the
+#        Python repr of its list, e.g. [Prescription(drugId='N02BE01', ...)]
+#   new: one FIELD-separated line per prescription or reaction, with the
+#        field order stated once in the prompt
+#
+# Counts use tiktoken when it is installed and its encoding can be loaded,
+# otherwise an estimate from LLM_CHARS_PER_TOKEN. Exits non-zero when the new
+# prompt is not smaller, so it can guard prompt edits.
+#
+#   python -m bench.prompt_tokens --items 1 --items 4 --items 16
+#   python -m bench.prompt_tokens --encoding cl100k_base
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from app import config, prompts
+from app.models import SimulateResult
+
+PAYLOAD_DIR = Path(__file__).parent / "payloads"
+
+OLD_INPUT_TEMPLATE = """
+    설명 유형: {explain}
+
+    입력:
+
+    환자 정보:
+    이름: {name}
+    생년월일: {birthdate}
+    성별: {sex}
+    체중: {weight} kg
+    키: {height} cm
+    혈압: {bloodPressure}
+    과거 병력: {pastDiseases}
+    현재 복용 약물: {currentMedications}
+    알레르기: {allergies}
+    가족력: {familyHistory}
+    증상: {symptoms}
+    발병 시기: {onset}
+    통증 수준: {painLevel}
+
+    시나리오:
+    처방 약물 1:
+    {prescription1}
+
+    부작용 1:
+    {reaction1}
+
+    추가 처방 약물:
+    {prescription2}
+
+    추가 부작용:
+    {reaction2}
+"""
+
+SECTIONS = ("prescription1", "reaction1", "prescription2", "reaction2")
+
+
+def token_counter(encoding):
+    # (count function, label)
+    try:
+        import tiktoken
+
+        tokenizer = tiktoken.get_encoding(encoding)
+        return lambda text: len(tokenizer.encode(text)), encoding
+    except Exception as e:  # not installed, or the encoding cannot be fetched
+        print(f"tiktoken unavailable ({type(e).__name__}); estimating {config.LLM_CHARS_PER_TOKEN} chars per token",
+              file=sys.stderr)
+        return lambda text: int(len(text) / config.LLM_CHARS_PER_TOKEN), "estimate"
+
+
+def scaled_request(template, items):
+    # The sample request with items entries per scenario section
+    scenario = {
+        section: [dict(entries[i % len(entries)]) for i in range(items)]
+        for section, entries in template["scenario"].items()
+    }
+    for section in ("prescription1", "prescription2"):
+        for i, entry in enumerate(scenario[section]):
+            entry["drugId"] = f"{entry['drugId'][:5]}{i:02d}"
+    return SimulateResult.model_validate(dict(template, scenario=scenario))
+
+
+def old_input(request: SimulateResult):
+    scenario = request.scenario
+    return OLD_INPUT_TEMPLATE.format(
+        explain=prompts.EXPLAIN_PROMPTS[request.explainType],
+        **{section: getattr(scenario, section) for section in SECTIONS},
+        **request.model_dump(exclude={"scenario", "explainType"}),
+    )
+
+
+def new_input(request: SimulateResult):
+    return prompts.patient_messages(request)[1]["content"][len(prompts.PATIENT_PREFIX):]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Token counts of simulate_patient prompts, old vs compact encoding")
+    parser.add_argument("--items", type=int, action="append", help="items per scenario section (repeatable)")
+    parser.add_argument("--encoding", default="o200k_base", help="tiktoken encoding (cl100k_base for gpt-3.5)")
+    args = parser.parse_args(argv)
+
+    count, label = token_counter(args.encoding)
+    template = json.loads((PAYLOAD_DIR / "simulate_patient.json").read_text(encoding="utf-8"))
+    prefix = count(prompts.SYSTEM_PROMPT) + count(prompts.PATIENT_PREFIX)
+    print(f"tokens ({label}); shared system prompt + prefix: {prefix}")
+    grew = False
+    for items in args.items or [1]:
+        request = scaled_request(template, items)
+        old, new = count(old_input(request)), count(new_input(request))
+        grew |= new >= old
+        print(f"{items:>4} items/section  input {old:6d} -> {new:6d} tokens ({(old - new) / old:6.1%} less)  "
+              f"whole prompt {prefix + old:6d} -> {prefix + new:6d} ({(old - new) / (prefix + old):6.1%} less)")
+    return 1 if grew else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
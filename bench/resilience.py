@@ -0,0 +1,141 @@
+# bench/resilience.py
+# Runs the app against bench.fake_openai with injected latency and faults and
+# checks how the upstream resilience layer (app/resilience.py) copes:
+#
+#   tail      5% of completions stall; p95/p99 with and without hedging
+#   errors    30% of completions fail with 500; success rate with and
+#             without retries
+#   deadline  every completion stalls; requests end with 504 at the deadline
+#   outage    the upstream goes down: expired cache entries are served
+#             stale, the breaker opens and fails fast with 503, then closes
+#             once the upstream is back
+#
+#   python -m bench.resilience
+#   python -m bench.resilience --scenario outage --requests 24
+import argparse
+import asyncio
+import json
+import time
+from argparse import Namespace
+from collections import Counter
+
+import httpx
+
+from .loadtest import PAYLOAD_DIR, free_port, make_payload, spawned_stack, summarize
+
+TEMPLATE = json.loads((PAYLOAD_DIR / "patient_info.json").read_text(encoding="utf-8"))
+
+
+async def fire(client, tag, indexes, concurrency):
+    # POSTs /simulation/result/ for each index; returns (status, seconds) pairs
+    results = []
+    queue = list(indexes)
+
+    async def worker():
+        while queue:
+            payload = make_payload(TEMPLATE, tag, queue.pop(0), True)
+            start = time.perf_counter()
+            try:
+                status = (await client.post("/simulation/result/", json=payload)).status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            results.append((status, time.perf_counter() - start))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+async def counters(client, *prefixes):
+    # Sample lines of /metrics whose name starts with one of prefixes
+    text = (await client.get("/metrics")).text
+    return {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in text.splitlines()
+        if line.startswith(prefixes) and "_bucket" not in line
+    }
+
+
+def report(label, results, extra=None):
+    statuses = Counter(status for status, _ in results)
+    latency = summarize([seconds for _, seconds in results])
+    print(f"  {label}: {dict(statuses)}  p50 {latency['p50'] * 1000:.0f} ms  p95 {latency['p95'] * 1000:.0f} ms  "
+          f"p99 {latency['p99'] * 1000:.0f} ms  max {latency['max'] * 1000:.0f} ms")
+    for name, value in (extra or {}).items():
+        print(f"    {name} {value:g}")
+
+
+def stack(args, env, upstream=(), upstream_port=None):
+    spawn = Namespace(ttft=args.ttft, tokens_per_sec=args.tokens_per_sec, time_scale=1.0,
+                      app_env=[f"{key}={value}" for key, value in env.items()])
+    return spawned_stack(spawn, upstream, upstream_port)
+
+
+async def tail(args):
+    print("tail: 5% of completions stall for 5 s")
+    for hedge in ("false", "true"):
+        with stack(args, {"LLM_HEDGE": hedge, "LLM_HEDGE_MIN_DELAY": "0.2"},
+                   ["--stall-rate", "0.05", "--stall", "5"]) as url:
+            async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+                # Warm-up fills the latency window hedging takes its delay from
+                await fire(client, "warm", range(30), args.concurrency)
+                results = await fire(client, "tail", range(args.requests), args.concurrency)
+                report(f"hedging {hedge}", results, await counters(client, "llm_hedges_total"))
+
+
+async def errors(args):
+    print("errors: 30% of completions fail with 500")
+    for attempts in ("1", "3"):
+        with stack(args, {"LLM_MAX_ATTEMPTS": attempts, "LLM_RETRY_BACKOFF": "0.1",
+                          "BREAKER_FAILURE_RATIO": "0.9"}, ["--error-rate", "0.3"]) as url:
+            async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+                results = await fire(client, "errors", range(args.requests), args.concurrency)
+                report(f"{attempts} attempt(s)", results, await counters(client, "llm_retries_total"))
+
+
+async def deadline(args):
+    print("deadline: every completion stalls for 30 s, DEADLINE_RESULT=2")
+    with stack(args, {"DEADLINE_RESULT": "2"}, ["--stall-rate", "1", "--stall", "30"]) as url:
+        async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+            report("stalled", await fire(client, "deadline", range(args.concurrency), args.concurrency))
+
+
+async def outage(args):
+    print("outage: the upstream fails every call, then recovers")
+    upstream_port = free_port()
+    env = {"RESULT_CACHE_TTL": "1", "BREAKER_MIN_CALLS": "5", "BREAKER_COOLDOWN": "3", "LLM_RETRY_BACKOFF": "0.1"}
+    with stack(args, env, upstream_port=upstream_port) as url:
+        async with httpx.AsyncClient(base_url=url, timeout=120) as client, \
+                httpx.AsyncClient(base_url=f"http://127.0.0.1:{upstream_port}") as upstream:
+            cached = range(args.concurrency)
+            report("warm cache", await fire(client, "outage", cached, args.concurrency))
+            await upstream.post("/faults", json={"errorRate": 1.0})
+            await asyncio.sleep(1.5)
+            report("down, expired entries (stale)", await fire(client, "outage", cached, args.concurrency))
+            results = await fire(client, "new", range(args.requests), args.concurrency)
+            stats = (await client.get("/stats")).json()["upstream"]
+            report("down, new patients", results, await counters(client, "llm_circuit_state", "response_cache_stale"))
+            print(f"    breaker: {json.dumps(stats['models'])}")
+            await upstream.post("/faults", json={"errorRate": 0.0})
+            await asyncio.sleep(3.5)
+            report("recovered", await fire(client, "back", range(args.requests), 1),
+                   await counters(client, "llm_circuit_state"))
+
+
+SCENARIOS = {"tail": tail, "errors": errors, "deadline": deadline, "outage": outage}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resilience checks against the fake upstream with injected faults")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS))
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("-n", "--requests", type=int, default=80)
+    parser.add_argument("--ttft", default="lognormal:0.3,0.3")
+    parser.add_argument("--tokens-per-sec", type=float, default=2000.0)
+    args = parser.parse_args(argv)
+
+    for name in args.scenario or list(SCENARIOS):
+        asyncio.run(SCENARIOS[name](args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# bench/serialization.py
+# Compares the per-response serialization cost of the old and new response
+# paths for a graph of a given size, without any network or upstream:
+#
+#   old: the raw model string returned as {content} (a set) -> jsonable_encoder
+#        -> JSONResponse, i.e. ["..."], and the client decodes twice
+#   new: orjson parse + pydantic validation of the model output, dumped once
+#        to the canonical JSON that is cached and sent as-is; a cache hit
+#        skips straight to sending. The client decodes once.
+#
+# The old path did the same work on a hit and a miss.
+#
+#   python -m bench.serialization --nodes 12 --nodes 120 --nodes 1200 -n 2000
+import argparse
+import json
+import time
+from pathlib import Path
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.responses import RawJSONResponse, dump, parse_graph
+
+PAYLOAD_DIR = Path(__file__).parent / "payloads"
+
+
+def scaled_graph(template, nodes):
+    # Repeats the sample graph with renumbered ids until it has ~nodes nodes
+    graph = {"nodes": [], "edges": [], "review": template["review"]}
+    copy = 0
+    while len(graph["nodes"]) < nodes:
+        suffix = f"-{copy}"
+        for node in template["nodes"]:
+            graph["nodes"].append(dict(node, id=node["id"] + suffix))
+        for edge in template["edges"]:
+            graph["edges"].append({"from": edge["from"] + suffix, "to": edge["to"] + suffix})
+        copy += 1
+    return graph
+
+
+def old_path(content):
+    response = JSONResponse(jsonable_encoder({content}))
+    return json.loads(json.loads(response.body)[0])
+
+
+def new_miss_path(content):
+    response = RawJSONResponse(dump(parse_graph(content)))
+    return orjson.loads(response.body)
+
+
+def new_hit_path(cached):
+    return orjson.loads(RawJSONResponse(cached).body)
+
+
+def timed(fn, content, iterations):
+    fn(content)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(content)
+    return (time.perf_counter() - start) / iterations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Response serialization micro-benchmark")
+    parser.add_argument("--nodes", type=int, action="append", help="graph size in nodes (repeatable)")
+    parser.add_argument("-n", "--iterations", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    template = json.loads((PAYLOAD_DIR / "graph.json").read_text(encoding="utf-8"))
+    for nodes in args.nodes or [len(template["nodes"])]:
+        graph = scaled_graph(template, nodes)
+        content = json.dumps(graph, ensure_ascii=False, indent=2)
+        cached = dump(parse_graph(content))
+        old = timed(old_path, content, args.iterations)
+        miss = timed(new_miss_path, content, args.iterations)
+        hit = timed(new_hit_path, cached, args.iterations)
+        old_body = len(JSONResponse(jsonable_encoder({content})).body)
+        print(f"{len(graph['nodes']):>6} nodes  old {old * 1e6:9.1f} us  new miss {miss * 1e6:9.1f} us  "
+              f"new hit {hit * 1e6:9.1f} us ({old / hit:5.1f}x)  body {old_body} -> {len(cached.encode())} bytes")
+
+
+if __name__ == "__main__":
+    main()
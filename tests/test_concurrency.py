@@ -0,0 +1,42 @@
+# tests/test_concurrency.py
+# Parallel requests must overlap their upstream calls: N patients sent at
+# once take about as long as one, not N times as long. Runs the app and the
+# fake upstream (bench/fake_openai.py) as real processes, as
+# bench/loadtest.py --spawn does.
+#
+#   python -m pytest tests/
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import httpx
+
+from bench.loadtest import PAYLOAD_DIR, make_payload, spawned_stack
+
+PARALLEL = 8
+TTFT = 1.0
+
+
+async def post_all(base_url, payloads):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.post("/simulation/result/", json=p) for p in payloads))
+        elapsed = time.perf_counter() - start
+    for response in responses:
+        response.raise_for_status()
+    return elapsed
+
+
+def test_parallel_requests_overlap():
+    template = json.loads((PAYLOAD_DIR / "patient_info.json").read_text(encoding="utf-8"))
+    args = SimpleNamespace(ttft=f"fixed:{TTFT}", tokens_per_sec=100000.0, time_scale=1.0, app_env=[])
+    with spawned_stack(args) as base_url:
+        # Unique names, so neither the cache nor request coalescing answers
+        # any of them without an upstream call
+        single = asyncio.run(post_all(base_url, [make_payload(template, "single", 0, True)]))
+        parallel = asyncio.run(post_all(
+            base_url, [make_payload(template, "parallel", i, True) for i in range(PARALLEL)]
+        ))
+    assert single >= TTFT
+    assert parallel < 2 * single, f"{PARALLEL} parallel requests took {parallel:.2f}s, one took {single:.2f}s"
@@ -0,0 +1,85 @@
+# tests/test_encoding.py
+# Properties of the compact encoding (app/encoding.py) that cache keys rely
+# on, and that it keeps the prompt smaller than the old form
+# (bench/prompt_tokens.py). Token counts need tiktoken and its encoding
+# files; without them that test is skipped.
+#
+#   python -m pytest tests/test_encoding.py
+import copy
+import json
+
+import pytest
+
+from app.cache import canonical_key
+from app.encoding import canonical
+from app.models import PatientFeatures, SimulateResult
+from bench.prompt_tokens import PAYLOAD_DIR, new_input, old_input, scaled_request
+
+TEMPLATE = json.loads((PAYLOAD_DIR / "simulate_patient.json").read_text(encoding="utf-8"))
+
+
+def request(**fields):
+    # The sample request with fields of the patient replaced
+    return dict(copy.deepcopy(TEMPLATE), **fields)
+
+
+def scenario_request(section, index, **fields):
+    data = copy.deepcopy(TEMPLATE)
+    data["scenario"][section][index].update(fields)
+    return SimulateResult.model_validate(data)
+
+
+def encode(data):
+    return canonical(SimulateResult.model_validate(data))
+
+
+def test_whitespace_is_ignored():
+    spaced = request(name=" 홍길동 ", pastDiseases="고혈압,   당뇨", symptoms="두통,\n복통")
+    spaced["scenario"]["prescription1"][0]["labelKo"] = "타이레놀  "
+    spaced["scenario"]["reaction1"][0]["explain"]["증상 예시"] = "황달,\t어두운 소변"
+    assert encode(spaced) == encode(request())
+
+
+def test_explain_entries_are_sorted():
+    data = request()
+    explain = data["scenario"]["reaction2"][0]["explain"]
+    data["scenario"]["reaction2"][0]["explain"] = dict(reversed(list(explain.items())))
+    assert encode(data) == encode(request())
+
+
+def test_other_payloads_ignore_key_order_and_whitespace():
+    a = PatientFeatures(sex="male", ageGroup="20대", pastDiseases="고혈압, 당뇨",
+                        currentMedications="살리실산계", allergies="없음")
+    b = PatientFeatures.model_validate(dict(reversed(list(a.model_dump().items())), pastDiseases="고혈압,  당뇨"))
+    assert canonical(a) == canonical(b)
+
+
+@pytest.mark.parametrize("first, second", [
+    # A separator inside a value must not read as a field or item boundary
+    (("prescription1", 0, {"drugType": "진통제|해열제", "labelKo": "타이레놀"}),
+     ("prescription1", 0, {"drugType": "진통제", "labelKo": "해열제|타이레놀"})),
+    (("prescription1", 0, {"efficacy": ["통증 완화;해열"]}),
+     ("prescription1", 0, {"efficacy": ["통증 완화", "해열"]})),
+    (("reaction1", 0, {"explain": {"발생 빈도=드묾": "황달"}}),
+     ("reaction1", 0, {"explain": {"발생 빈도": "드묾=황달"}})),
+    (("reaction1", 0, {"explain": {"a": "b;c=d"}}),
+     ("reaction1", 0, {"explain": {"a": "b", "c": "d"}})),
+    (("reaction1", 0, {"label": "간\\", "alert": "주의"}),
+     ("reaction1", 0, {"label": "간", "alert": "\\주의"})),
+])
+def test_distinct_scenarios_never_collide(first, second):
+    a = scenario_request(first[0], first[1], **first[2])
+    b = scenario_request(second[0], second[1], **second[2])
+    assert canonical(a) != canonical(b)
+    assert canonical_key(a, "model", "1") != canonical_key(b, "model", "1")
+
+
+@pytest.mark.parametrize("items", [1, 4, 16])
+def test_new_prompt_has_fewer_tokens(items):
+    tiktoken = pytest.importorskip("tiktoken")
+    try:
+        tokenizer = tiktoken.get_encoding("o200k_base")
+    except Exception as e:  # the encoding files cannot be fetched
+        pytest.skip(f"tiktoken encoding unavailable: {e!r}")
+    scaled = scaled_request(TEMPLATE, items)
+    assert len(tokenizer.encode(new_input(scaled))) < len(tokenizer.encode(old_input(scaled)))
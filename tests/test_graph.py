@@ -0,0 +1,125 @@
+# tests/test_graph.py
+# The deterministic repairs fix_graph (app/graph.py) makes to a generated
+# graph, each recorded in meta.repairs.
+#
+#   python -m pytest tests/test_graph.py
+import pytest
+
+from app.graph import fix_graph
+from app.models import Edge, GraphMeta, PrescriptionNode, ReactionNode, SimulationGraph
+
+
+def prescription(node_id):
+    return PrescriptionNode(id=node_id, drugId="N02BE01", drugType="진통제", labelKo="타이레놀",
+                            labelEn="Tylenol", efficacy=["통증 완화"])
+
+
+def reaction(node_id):
+    return ReactionNode(id=node_id, label="간 기능 저하", explain={"발생 빈도": "드묾"}, alert="주의")
+
+
+def node(node_id):
+    return prescription(node_id) if node_id.startswith("prescription") else reaction(node_id)
+
+
+# A valid cascade: prescription1-1 -> reaction1-1 -> prescription2-1 -> reaction2-1
+NODES = ["prescription1-1", "reaction1-1", "prescription2-1", "reaction2-1"]
+EDGES = [("prescription1-1", "reaction1-1"), ("reaction1-1", "prescription2-1"), ("prescription2-1", "reaction2-1")]
+
+
+def graph(nodes=(), edges=(), repairs=()):
+    return SimulationGraph(
+        nodes=[node(node_id) if isinstance(node_id, str) else node_id for node_id in [*NODES, *nodes]],
+        edges=[Edge(source=source, to=to) for source, to in [*EDGES, *edges]],
+        review="검토",
+        meta=GraphMeta(repairs=list(repairs)),
+    )
+
+
+def edge_pairs(fixed):
+    return [(edge.source, edge.to) for edge in fixed.edges]
+
+
+def test_valid_graph_is_returned_as_is():
+    valid = graph()
+    assert fix_graph(valid) is valid
+
+
+@pytest.mark.parametrize("bad, repair", [
+    ("prescription3-1", "dropped node 'prescription3-1': id is not <tier>-<n>"),
+    ("reaction1", "dropped node 'reaction1': id is not <tier>-<n>"),
+    ("drug-1", "dropped node 'drug-1': id is not <tier>-<n>"),
+    (reaction("prescription1-2"), "dropped node 'prescription1-2': not a prescription1 node"),
+    (prescription("reaction2-2"), "dropped node 'reaction2-2': not a reaction2 node"),
+])
+def test_bad_nodes_are_dropped(bad, repair):
+    fixed = fix_graph(graph(nodes=[bad]))
+    assert [n.id for n in fixed.nodes] == NODES
+    assert fixed.meta.repairs == [repair]
+
+
+def test_duplicate_node_keeps_the_first():
+    duplicate = prescription("prescription1-1").model_copy(update={"labelKo": "중복"})
+    fixed = fix_graph(graph(nodes=[duplicate]))
+    assert [n.id for n in fixed.nodes] == NODES
+    assert fixed.nodes[0].labelKo == "타이레놀"
+    assert fixed.meta.repairs == ["dropped node 'prescription1-1': duplicate id"]
+
+
+@pytest.mark.parametrize("extra, repair", [
+    (("prescription1-1", "reaction1-9"), "dropped edge prescription1-1->reaction1-9: unknown node 'reaction1-9'"),
+    (("reaction0-1", "prescription2-1"), "dropped edge reaction0-1->prescription2-1: unknown node 'reaction0-1'"),
+    (("prescription1-1", "prescription2-1"), "dropped edge prescription1-1->prescription2-1: skips the tier order"),
+    (("prescription1-1", "reaction2-1"), "dropped edge prescription1-1->reaction2-1: skips the tier order"),
+    (("reaction2-1", "reaction1-1"), "dropped edge reaction2-1->reaction1-1: skips the tier order"),
+    (("reaction1-1", "reaction1-1"), "dropped edge reaction1-1->reaction1-1: skips the tier order"),
+    (("reaction1-1", "prescription2-1"), "dropped edge reaction1-1->prescription2-1: duplicate"),
+])
+def test_bad_edges_are_dropped(extra, repair):
+    fixed = fix_graph(graph(edges=[extra]))
+    assert edge_pairs(fixed) == EDGES
+    assert fixed.meta.repairs == [repair]
+
+
+def test_edge_one_tier_backwards_is_reversed():
+    fixed = fix_graph(graph(nodes=["reaction1-2"], edges=[("reaction1-2", "prescription1-1")]))
+    assert edge_pairs(fixed) == [*EDGES, ("prescription1-1", "reaction1-2")]
+    assert fixed.meta.repairs == ["reversed edge reaction1-2->prescription1-1"]
+
+
+def test_reversed_edge_that_duplicates_one_is_dropped():
+    fixed = fix_graph(graph(edges=[("reaction1-1", "prescription1-1")]))
+    assert edge_pairs(fixed) == EDGES
+    assert fixed.meta.repairs == [
+        "reversed edge reaction1-1->prescription1-1",
+        "dropped edge prescription1-1->reaction1-1: duplicate",
+    ]
+
+
+def test_edges_of_dropped_nodes_are_dropped():
+    fixed = fix_graph(graph(nodes=[reaction("prescription2-2")], edges=[("reaction1-1", "prescription2-2")]))
+    assert edge_pairs(fixed) == EDGES
+    assert fixed.meta.repairs == [
+        "dropped node 'prescription2-2': not a prescription2 node",
+        "dropped edge reaction1-1->prescription2-2: unknown node 'prescription2-2'",
+    ]
+
+
+def test_every_repair_is_recorded_after_earlier_ones():
+    fixed = fix_graph(graph(
+        nodes=["drug-1", "reaction1-1"],
+        edges=[("reaction1-1", "prescription1-1"), ("prescription1-1", "reaction2-1"), ("drug-1", "reaction1-1")],
+        repairs=["dropped node 'prescription9-1': screened out"],
+    ))
+    assert [n.id for n in fixed.nodes] == NODES
+    assert edge_pairs(fixed) == EDGES
+    assert fixed.review == "검토"
+    assert fixed.meta.repairs == [
+        "dropped node 'prescription9-1': screened out",
+        "dropped node 'drug-1': id is not <tier>-<n>",
+        "dropped node 'reaction1-1': duplicate id",
+        "reversed edge reaction1-1->prescription1-1",
+        "dropped edge prescription1-1->reaction1-1: duplicate",
+        "dropped edge prescription1-1->reaction2-1: skips the tier order",
+        "dropped edge drug-1->reaction1-1: unknown node 'drug-1'",
+    ]
@@ -0,0 +1,96 @@
+# tests/test_jsonrepair.py
+# The JSON defects app/jsonrepair.py repairs, and the clean / repaired /
+# failed outcomes load_json (app/responses.py) reports for them.
+#
+#   python -m pytest tests/test_jsonrepair.py
+import json
+
+import pytest
+
+from app import metrics
+from app.jsonrepair import repair
+from app.responses import MalformedModelOutput, load_json, parse_model
+from app.models import ExplanationFragment
+
+PRESCRIPTION = '{"drugId": "N02BE01", "drugType": "진통제", "labelKo": "타이레놀"}'
+
+# (text the model wrote, what it should repair to, fixes counted)
+REPAIRED = [
+    # Missing comma after "drugType": "..."
+    ('{"drugId": "N02BE01", "drugType": "진통제"\n "labelKo": "타이레놀"}', json.loads(PRESCRIPTION), 1),
+    # Missing comma after an explain object
+    ('[{"label": "두통", "explain": {"빈도": "흔함"}\n "alert": "주의"}]',
+     [{"label": "두통", "explain": {"빈도": "흔함"}, "alert": "주의"}], 1),
+    # Missing comma between two elements
+    ('{"edges": [{"from": "a", "to": "b"} {"from": "b", "to": "c"}]}',
+     {"edges": [{"from": "a", "to": "b"}, {"from": "b", "to": "c"}]}, 1),
+    # Trailing commas in nodes and in the root
+    ('{"nodes": [{"id": "a"}, {"id": "b"},\n],}', {"nodes": [{"id": "a"}, {"id": "b"}]}, 2),
+    # Doubled comma
+    ('{"a": 1,, "b": 2}', {"a": 1, "b": 2}, 1),
+    # Missing comma after a number, true and null
+    ('{"a": 1 "b": true "c": null "d": -2.5e3}', {"a": 1, "b": True, "c": None, "d": -2500.0}, 3),
+    # Code fences and prose around the root
+    ('```json\n' + PRESCRIPTION + '\n```', json.loads(PRESCRIPTION), 1),
+    ('다음은 결과입니다: ' + PRESCRIPTION + ' 참고하세요.', json.loads(PRESCRIPTION), 1),
+    # Leading prose with brackets of its own
+    ('Here [is] it: {"a": 1, "b": [1, 2,],}', {"a": 1, "b": [1, 2]}, 3),
+    # Commas and brackets inside strings are left alone
+    ('{"a": "x, y]" "b": "{\\"q\\",}"}', {"a": "x, y]", "b": '{"q",}'}, 1),
+]
+
+
+@pytest.mark.parametrize("text, expected, fixes", REPAIRED)
+def test_repairs(text, expected, fixes):
+    repaired, count = repair(text)
+    assert json.loads(repaired) == expected
+    assert count == fixes
+
+
+def test_clean_json_is_unchanged():
+    assert repair(PRESCRIPTION) == (PRESCRIPTION, 0)
+
+
+def test_object_root_skips_arrays_in_prose():
+    text = 'See [1] and [2]: {"x": {"y": 1} "z": 2} thanks'
+    assert json.loads(repair(text)[0]) == [1]
+    assert json.loads(repair(text, roots="{")[0]) == {"x": {"y": 1}, "z": 2}
+
+
+@pytest.mark.parametrize("text", [
+    # Truncated output is not completed
+    '{"nodes": [{"id": "a"}, {"id": "b"',
+    '```json\n{"a": [1, 2',
+    # No JSON at all
+    "죄송합니다. 답변할 수 없습니다.",
+])
+def test_unrepairable_text_still_fails(text):
+    repaired, _ = repair(text)
+    with pytest.raises(ValueError):
+        json.loads(repaired)
+
+
+def outcomes(kind):
+    return {outcome: count for (sample_kind, outcome), count in metrics.llm_output_json.samples().items()
+            if sample_kind == kind}
+
+
+@pytest.mark.parametrize("text, outcome", [
+    (PRESCRIPTION, "clean"),
+    ('{"drugId": "N02BE01" "drugType": "진통제",}', "repaired"),
+    ('{"drugId": "N02BE01", "drugType": "진', "failed"),
+    ("모델이 JSON 대신 쓴 문장", "failed"),
+])
+def test_load_json_reports_outcome(text, outcome):
+    kind = f"test_{outcome}_{abs(hash(text))}"
+    if outcome == "failed":
+        with pytest.raises(MalformedModelOutput):
+            load_json(text, kind)
+    else:
+        load_json(text, kind)
+    assert outcomes(kind) == {outcome: 1}
+
+
+def test_models_expect_an_object_root():
+    content = '참고 [1]: {"items": [{"a": 1},]}'
+    assert parse_model(content, ExplanationFragment, "test_model_root").items == [{"a": 1}]
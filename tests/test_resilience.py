@@ -0,0 +1,88 @@
+# tests/test_resilience.py
+# The upstream resilience layer (app/resilience.py) against the fake
+# upstream with injected faults: the scenarios of bench/resilience.py, with
+# the outcomes asserted.
+#
+#   python -m pytest tests/test_resilience.py
+import asyncio
+from argparse import Namespace
+
+import httpx
+
+from bench.loadtest import free_port
+from bench.resilience import TEMPLATE, counters, fire, stack
+
+ARGS = Namespace(ttft="fixed:0.2", tokens_per_sec=100000.0)
+CONCURRENCY = 8
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def statuses(results):
+    return [status for status, _ in results]
+
+
+def test_retries_recover_most_errors():
+    env = {"LLM_MAX_ATTEMPTS": "3", "LLM_RETRY_BACKOFF": "0.1", "BREAKER_FAILURE_RATIO": "0.9"}
+
+    async def scenario(url):
+        async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+            results = await fire(client, "errors", range(40), CONCURRENCY)
+            return results, await counters(client, "llm_retries_total")
+
+    with stack(ARGS, env, ["--error-rate", "0.3"]) as url:
+        results, retries = run(scenario(url))
+    # Three attempts at 30% each leave about 3% of requests failing
+    assert statuses(results).count(200) >= 36, statuses(results)
+    assert sum(retries.values()) > 0
+
+
+def test_stall_ends_in_504_at_the_deadline():
+    async def scenario(url):
+        async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+            return await fire(client, "deadline", range(4), 4)
+
+    with stack(ARGS, {"DEADLINE_RESULT": "2"}, ["--stall-rate", "1", "--stall", "30"]) as url:
+        results = run(scenario(url))
+    assert statuses(results) == [504] * 4
+    assert all(1.5 < seconds < 5 for _, seconds in results), results
+
+
+def test_outage_serves_stale_then_fails_fast_then_recovers():
+    upstream_port = free_port()
+    env = {"RESULT_CACHE_TTL": "1", "BREAKER_MIN_CALLS": "5", "BREAKER_COOLDOWN": "3", "LLM_RETRY_BACKOFF": "0.1"}
+
+    async def breaker(client):
+        return (await client.get("/stats")).json()["upstream"]["models"]["gpt-4o"]["circuit"]
+
+    async def scenario(url):
+        async with httpx.AsyncClient(base_url=url, timeout=60) as client, \
+                httpx.AsyncClient(base_url=f"http://127.0.0.1:{upstream_port}") as upstream:
+            cached = range(4)
+            assert statuses(await fire(client, "outage", cached, 4)) == [200] * 4
+
+            await upstream.post("/faults", json={"errorRate": 1.0})
+            await asyncio.sleep(1.5)
+            # Expired entries are served instead of an error
+            assert statuses(await fire(client, "outage", cached, 4)) == [200] * 4
+            stale = await counters(client, "response_cache_stale_served_total")
+            assert stale['response_cache_stale_served_total{cache="result"}'] >= 4
+
+            # New patients have nothing stored: the breaker opens and answers
+            # 503 with Retry-After without calling the upstream
+            await fire(client, "new", range(16), CONCURRENCY)
+            assert await breaker(client) == "open"
+            response = await client.post("/simulation/result/", json=dict(TEMPLATE, name="fast-fail"))
+            assert response.status_code == 503
+            assert int(response.headers["retry-after"]) >= 1
+
+            await upstream.post("/faults", json={"errorRate": 0.0})
+            await asyncio.sleep(3.5)
+            recovered = await fire(client, "back", range(8), 1)
+            assert statuses(recovered) == [200] * 8, statuses(recovered)
+            assert await breaker(client) == "closed"
+
+    with stack(ARGS, env, upstream_port=upstream_port) as url:
+        run(scenario(url))